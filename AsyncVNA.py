@@ -0,0 +1,140 @@
+# PySDRVNA Toolkit is a Python toolkit to use your Software Defined Radio
+# as a simple Vector Network Analyzer.
+# Copyright (c) 2013 by Steve Haynal, KF7O.
+
+# PySDRVNA Toolkit is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3.
+
+# PySDRVNA Toolkit is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License at <http://www.gnu.org/licenses/> for details.
+
+## asyncio interface to the VNA. Captures complete a future from the Jack
+## thread and settle, warmup and cooldown delays are asyncio sleeps, so the
+## event loop keeps running other instruments during a sweep.
+##
+##   vna = AsyncVNA()
+##   reading = await vna.Measure(14000000)
+##   async for i, freq, reading, quality in vna.Sweep(m):
+##     ...
+
+import asyncio
+import numpy as np
+
+from VNA import *
+
+
+class AsyncVNA(VNA):
+  """VNA with Coroutine Versions of the Measurement Methods, the Blocking Methods Still Work"""
+
+  @staticmethod
+  def Resolve(fut):
+    if not fut.done(): fut.set_result(None)
+
+  async def CaptureAsync(self):
+    """Capture One Jack Array Length without Blocking the Event Loop"""
+    loop = asyncio.get_event_loop()
+    fut = loop.create_future()
+    ## Called from the Jack thread
+    self.capturedone = lambda: loop.call_soon_threadsafe(self.Resolve,fut)
+    try:
+      self.StartCapture()
+      await fut
+    finally:
+      ## If cancelled, stop the callback writing into the capture arrays
+      self.CancelCapture()
+      self.capturedone = None
+    self.FinishCapture()
+
+  async def CaptureOnceAsync(self,ptt=True):
+    """Capture with Optional PTT, Return False if an Xrun Occurred"""
+    if ptt: self.PTT(1)
+    ## Cancellation must not leave the transmitter keyed
+    try:
+      self.Stamp('ptton')
+      await self.CaptureAsync()
+      self.Stamp('capture')
+    finally:
+      if ptt: self.PTT(0)
+    self.Stamp('pttoff')
+
+    return not self.xrun.is_set()
+
+  async def TuneAsync(self,freq,word=None):
+    """Tune so the Test Tone is at freq and Wait for the SoftRock to Settle"""
+    self.SetTune(freq,word)
+    self.Stamp('setfreq')
+    await asyncio.sleep(self.settletime[self.retune])
+    self.Stamp('settle')
+
+  async def DoWarmUpAsync(self):
+    if self.warmuptime:
+      self.PTT(1)
+      try:
+        await asyncio.sleep(self.warmuptime)
+      finally:
+        self.PTT(0)
+      await self.DoCoolDownAsync()
+
+  async def DoCoolDownAsync(self):
+    if self.cooldowntime:
+      await asyncio.sleep(self.cooldowntime)
+
+  async def MAsync(self,freq=None,ptt=True,warmup=False,word=None):
+    """Main Measurement Method, Return False and NaN Readings if All Attempts Fail"""
+    self.TimingStart()
+    if freq: await self.TuneAsync(freq,word)
+
+    if warmup: await self.DoWarmUpAsync()
+
+    attempts = self.attempts
+    self.syncfailrun = 0
+    success = False
+    while attempts > 0 and not success:
+      attempts = attempts - 1
+      if self.Detuned(): await self.TuneAsync(self.tunedfreq)
+      try:
+        success = self.CheckAttempt(await self.CaptureOnceAsync(ptt))
+      except Exception as e:
+        self.FailedAttempt(e)
+
+    return self.EndAttempts(success)
+
+  async def Measure(self,freq=None,ptt=True,warmup=False):
+    """Measure the Test Tone at freq Hz, Return the Reading, NaN on Failure"""
+    await self.MAsync(freq,ptt,warmup)
+    self.Mprint()
+    return self.reading
+
+  async def Sweep(self,m,array=None,plan=None):
+    """Measure Each Frequency of a Measurement into array, m.dut by Default
+
+    Yields the frequency index, frequency in MHz, reading and quality of each point
+    like SweepIter."""
+    if array is None: array = m.dut
+    self.ResetStats()
+    self.RecordSweep(m.freq)
+    try:
+      await self.DoWarmUpAsync()
+      for f, indices, word in self.PlanSteps(m.freq,plan):
+        success = await self.MAsync(f,word=word)
+        if success:
+          self.Record(f,indices)
+          self.Mprint()
+        else:
+          self.Record(f,indices,synced=False)
+          self.failed.extend(indices)
+        for j, i in enumerate(indices):
+          array[i] = self.readings[j]
+        self.Stamp('print')
+        quality = self.syncconf if success else 0.0
+        for j, i in enumerate(indices):
+          yield i, m.freq[i], self.readings[j], quality
+        await self.DoCoolDownAsync()
+    finally:
+      self.PTT(0)
+      self.PrintStats()
+      ## Flush blocks until the progress thread catches up, so wait for it off the event loop
+      await asyncio.get_event_loop().run_in_executor(None,self.progress.Flush)
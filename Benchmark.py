@@ -0,0 +1,158 @@
+# PySDRVNA Toolkit is a Python toolkit to use your Software Defined Radio
+# as a simple Vector Network Analyzer.
+# Copyright (c) 2013 by Steve Haynal, KF7O.
+
+# PySDRVNA Toolkit is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3.
+
+# PySDRVNA Toolkit is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License at <http://www.gnu.org/licenses/> for details.
+
+## Throughput and latency benchmarks run against the simulated backend.
+## Results are saved as JSON so releases can be compared with Compare.
+
+from __future__ import print_function
+import numpy as np
+import json, time, platform, getopt, sys, os
+
+from VNA import *
+import config
+
+
+STAGES = TIMINGSTAGES
+
+def BenchConfig(**overrides):
+  '''Return a Simulated VNA Configuration without Warmup or Cooldown Delays'''
+  configd = dict(config.__dict__)
+  configd['backend'] = 'sim'
+  configd['warmuptime'] = 0.0
+  configd['cooldowntime'] = 0.0
+  configd['printlevel'] = 0
+  configd.update(overrides)
+  return configd
+
+def Summary(a):
+  '''Return Mean, Median, 99th Percentile and a Histogram of Latencies in Seconds'''
+  a = np.asarray(a,dtype=float)
+  if a.size == 0: return {}
+  lo = max(a.min(),1e-7)
+  edges = np.logspace(np.log10(lo),np.log10(max(a.max(),lo*1.01)),21)
+  counts, edges = np.histogram(a,edges)
+  return {'n':int(a.size), 'mean':float(a.mean()), 'p50':float(np.percentile(a,50)),
+          'p99':float(np.percentile(a,99)), 'max':float(a.max()),
+          'hist':[int(c) for c in counts], 'edges':[float(e) for e in edges]}
+
+def BenchSweep(points,fftn,**overrides):
+  '''Time a Sweep of points Frequencies, Return Points/s and Per Stage Latencies'''
+  vna = VNA(BenchConfig(fftn=fftn,timing=points,**overrides))
+  m = Measurement(list(14.0 + 0.001*np.arange(points)))
+
+  t = time.perf_counter()
+  vna.M2Array(m.freq,m.dut)
+  elapsed = time.perf_counter() - t
+  d = vna.TimingDurations()
+  vna.Close()
+
+  return {'points':points, 'fftn':fftn, 'captures':d.shape[0], 'pointspersec':points/elapsed,
+          'stages':dict((s,Summary(d[~np.isnan(d[:,k]),k])) for k, s in enumerate(STAGES))}
+
+def BenchMeasurement(points,repeats=5):
+  '''Time Measurement Z, Gamma and SWR, Return Points/s of Each'''
+  rng = np.random.RandomState(0)
+  m = Measurement(list(np.linspace(1.0,30.0,points)))
+  for a in [m.open,m.short,m.load,m.dut]:
+    a[:] = rng.randn(points) + 1j * rng.randn(points)
+  r = {'points':points}
+  for name in ['Z','Gamma','SWR']:
+    f = getattr(m,name)
+    best = None
+    for k in range(repeats):
+      t = time.perf_counter()
+      f()
+      dt = time.perf_counter() - t
+      if best is None or dt < best: best = dt
+    r[name] = points/best
+  return r
+
+def Run(sweeps=[10,100],fftns=[512,1024,2048,4096],mpoints=[1000,10000,100000,1000000],**overrides):
+  '''Run All Benchmarks and Return the Results'''
+  results = {'time':time.time(), 'python':platform.python_version(), 'numpy':np.__version__,
+             'machine':platform.machine(), 'overrides':overrides, 'sweeps':[], 'measurement':[]}
+  for fftn in fftns:
+    for points in sweeps:
+      r = BenchSweep(points,fftn,**overrides)
+      print("Sweep points:%d fftn:%d points/s:%.1f" % (points,fftn,r['pointspersec']),end=" ")
+      print(" ".join("%s p50:%.2fms p99:%.2fms" % (s,1e3*r['stages'][s]['p50'],1e3*r['stages'][s]['p99']) for s in STAGES if r['stages'][s]))
+      results['sweeps'].append(r)
+  for points in mpoints:
+    r = BenchMeasurement(points)
+    print("Measurement points:%d Z:%.3g Gamma:%.3g SWR:%.3g points/s" % (points,r['Z'],r['Gamma'],r['SWR']))
+    results['measurement'].append(r)
+  return results
+
+def SaveResults(results,fn):
+  '''Save Benchmark Results as JSON'''
+  f = open(fn,'w')
+  json.dump(results,f,indent=1)
+  f.close()
+
+def LoadResults(fn):
+  '''Load Benchmark Results Saved by SaveResults'''
+  f = open(fn,'r')
+  results = json.load(f)
+  f.close()
+  return results
+
+def Compare(old,new):
+  '''Print the Ratio of New to Old Throughputs, Above 1 is Faster'''
+  oldsweeps = dict(((r['points'],r['fftn']),r) for r in old['sweeps'])
+  for r in new['sweeps']:
+    o = oldsweeps.get((r['points'],r['fftn']))
+    if o is None: continue
+    print("Sweep points:%d fftn:%d points/s x%.2f" % (r['points'],r['fftn'],r['pointspersec']/o['pointspersec']),end=" ")
+    print(" ".join("%s p50 x%.2f" % (s,o['stages'][s]['p50']/r['stages'][s]['p50']) for s in STAGES if r['stages'][s].get('p50') and o['stages'].get(s,{}).get('p50')))
+  oldm = dict((r['points'],r) for r in old['measurement'])
+  for r in new['measurement']:
+    o = oldm.get(r['points'])
+    if o is None: continue
+    print("Measurement points:%d" % r['points'],end=" ")
+    print(" ".join("%s x%.2f" % (name,r[name]/o[name]) for name in ['Z','Gamma','SWR']))
+
+
+if __name__ == '__main__':
+
+  def PrintUsage():
+    print('python3 Benchmark.py [-q] [-s simspeed] [-o results.json] [-c baseline.json]')
+    print('  -q quick run with small sweeps and measurements')
+    print('  -s speed of the simulated Jack server relative to real time')
+    print('  -o save results, -c compare against saved results')
+
+  try:
+    opts, args = getopt.getopt(sys.argv[1:],"hqs:o:c:",[])
+  except getopt.GetoptError:
+    PrintUsage()
+    os._exit(2)
+
+  kwargs = {}
+  overrides = {}
+  out = None
+  baseline = None
+  for opt, arg in opts:
+    if opt == '-h':
+      PrintUsage()
+      os._exit(0)
+    elif opt == '-q':
+      kwargs = {'sweeps':[10], 'fftns':[1024], 'mpoints':[1000,10000]}
+    elif opt == '-s':
+      overrides['simspeed'] = float(arg)
+    elif opt == '-o':
+      out = arg
+    elif opt == '-c':
+      baseline = arg
+
+  results = Run(**dict(kwargs,**overrides))
+  if out: SaveResults(results,out)
+  if baseline: Compare(LoadResults(baseline),results)
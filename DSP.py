@@ -0,0 +1,298 @@
+# PySDRVNA Toolkit is a Python toolkit to use your Software Defined Radio
+# as a simple Vector Network Analyzer.
+# Copyright (c) 2013 by Steve Haynal, KF7O.
+
+# PySDRVNA Toolkit is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3.
+
+# PySDRVNA Toolkit is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License at <http://www.gnu.org/licenses/> for details.
+
+## Stateless stimulus, sync and detector functions.
+## VNA keeps its state on the instance and calls these, BatchReplay calls them
+## from a pool of processes to reprocess a recording on all cores.
+
+from __future__ import print_function
+import numpy as np
+import multiprocessing
+
+from Recorder import *
+import config
+
+
+def ToneLayout(fftbin,fftn,Sr,tones,tonestep):
+  """Return the Test Tone Bins, Spacing in Hz and Schroeder Phases"""
+  if tones > 1 and tonestep < 2:
+    raise ValueError("Test tones must be at least 2 FFT bins apart")
+  tonebins = fftbin + tonestep * np.arange(tones)
+  if tonebins[-1] >= fftn/2:
+    raise ValueError("Highest test tone is above the Nyquist frequency")
+  ## Spacing in Hz, which is also the sweep step a capture covers per tone
+  tonespacing = (float(tonestep)/fftn) * Sr
+  ## Schroeder phases keep the crest factor of the summed tones low
+  tonephases = -np.pi * np.arange(tones)**2 / tones
+  return tonebins, tonespacing, tonephases
+
+def Stimulus(freq,samples,dt,amp,tonespacing,tonephases,rtframes2sync,length):
+  """Return the I and Q Stimulus, a 180 Degree Phase Reversal after rtframes2sync then length Frames of Tone"""
+  oIa = np.zeros(samples, dtype=np.float32)
+  oQa = np.zeros(samples, dtype=np.float32)
+
+  ## Each tone shares the amplitude so the summed stimulus does not clip
+  amp = amp / len(tonephases)
+  for j in range(len(tonephases)):
+    tfreq = freq + (j * tonespacing)
+
+    ## 100 frames warmup
+    sf = 0
+    ef = rtframes2sync
+    s = np.pi + tonephases[j] + (2*np.pi*tfreq*(dt * np.r_[sf:ef]))
+    oIa[sf:ef] += amp * np.cos(s)
+    oQa[sf:ef] += amp * np.sin(s)
+
+    # For IQ balancing
+    #oIa[sf:ef] = sp.cos(s) - (sp.sin(s)*(1+oalpha)*sp.sin(ophi))
+    #oQa[sf:ef] = sp.sin(s)*(1+oalpha)*sp.cos(ophi)
+
+    ## 180 phase change
+    sf = ef
+    ef = ef + length
+    s = tonephases[j] + (2*np.pi*tfreq*(dt * np.r_[sf:ef]))
+    oIa[sf:ef] += amp * np.cos(s)
+    oQa[sf:ef] += amp * np.sin(s)
+
+  return oIa, oQa
+
+def SyncPhase(iIa,iQa,minrtframes,rtframes2sync):
+  """Locate the Sync Phase Shift by Amplitude and Phase Step, Return Index, Confidence and Fractional Index"""
+  ## Find start by amplitude
+  mv = 0.7 * iIa[minrtframes:].max()
+  sia = np.nonzero( iIa[minrtframes:] > mv )[0]
+  si = sia[0] + minrtframes
+
+  ## Phase change
+  synca = iIa[si:si+(2*rtframes2sync)] - 1j * iQa[si:si+(2*rtframes2sync)]
+  anglea = np.angle(synca,deg=True) + 180
+  deltaaa = (anglea[1:] - anglea[:-1]) % 360
+
+  ## Find sync index
+  try:
+      k = np.nonzero( (deltaaa > 90) & (deltaaa < 270) )[0][0]
+  except:
+      raise IndexError("Jack arrays are not long enough and/or bad sync. Resize arrays.")
+  syncindex = k + si
+
+  return syncindex, PhaseStepConfidence(deltaaa,k), float(syncindex)
+
+def PhaseStepConfidence(deltaaa,k):
+  """Return 1.0 for an Exact 180 Degree Step at k Falling to 0.0 at 90 Degrees Off"""
+  ## Phase steps are measured against the steady per sample advance of the test tone
+  advance = np.angle(np.mean(np.exp(1j*np.radians(deltaaa))),deg=True)
+  step = (deltaaa[k] - advance) % 360
+  return max(0.0, 1.0 - (abs(step - 180) / 90.0))
+
+def SyncXCorr(iIa,iQa,template,minrtframes,rtframes2sync,confidence,templatefft=None):
+  """Locate the Sync Phase Shift by Correlation with the Stimulus, Return Index, Confidence and Fractional Index
+
+  templatefft is an optional dictionary caching the template spectrum per FFT length."""
+  t = template
+  x = iIa[minrtframes:] - 1j * iQa[minrtframes:]
+  lags = x.size - t.size + 1
+  if lags < 3:
+    raise IndexError("Jack arrays are not long enough and/or bad sync. Resize arrays.")
+
+  ## FFT correlation
+  nfft = 1 << int(np.ceil(np.log2(x.size + t.size)))
+  if templatefft is None: templatefft = {}
+  if nfft not in templatefft:
+    templatefft[nfft] = np.conj(np.fft.fft(t,nfft))
+  c = np.abs(np.fft.ifft(np.fft.fft(x,nfft) * templatefft[nfft])[:lags])
+
+  peak = int(np.argmax(c))
+
+  ## Normalized correlation at the peak
+  xe = np.sum(np.abs(x[peak:peak+t.size])**2)
+  te = np.sum(np.abs(t)**2)
+  conf = c[peak] / np.sqrt(xe * te) if xe > 0 else 0.0
+  if conf < confidence:
+    raise IndexError("Correlation sync confidence %.2f too low. Check levels or resize arrays." % conf)
+
+  ## Sub-sample peak by parabolic interpolation
+  frac = 0.0
+  if 0 < peak < lags-1:
+    d = c[peak-1] - (2*c[peak]) + c[peak+1]
+    if d != 0: frac = 0.5 * (c[peak-1] - c[peak+1]) / d
+
+  ## Sample before the reversal, as found by the phase method
+  lag = peak + minrtframes + rtframes2sync - 1
+  return lag, conf, lag + frac
+
+def SyncTrack(iIa,iQa,last,tol,syncmode,template,rtframes2sync,confidence):
+  """Verify the Sync Phase Shift Near the Last Sync Index, Return Index, Confidence and Fractional Index or None"""
+  if syncmode == 'xcorr':
+    ## Direct correlation over the few lags around the last peak
+    t = template
+    start = last - rtframes2sync + 1 - tol
+    if start < 0 or start + t.size + (2*tol) > iIa.size: return None
+    x = iIa[start:start+t.size+(2*tol)] - 1j * iQa[start:start+t.size+(2*tol)]
+    c = np.abs(np.correlate(x,t,'valid'))
+    peak = int(np.argmax(c))
+    if peak == 0 or peak == c.size-1: return None
+    xe = np.sum(np.abs(x[peak:peak+t.size])**2)
+    if xe <= 0: return None
+    conf = c[peak] / np.sqrt(xe * np.sum(np.abs(t)**2))
+    if conf < confidence: return None
+    d = c[peak-1] - (2*c[peak]) + c[peak+1]
+    frac = 0.5 * (c[peak-1] - c[peak+1]) / d if d != 0 else 0.0
+    lag = start + peak + rtframes2sync - 1
+    return lag, conf, lag + frac
+  else:
+    ## Exactly one phase step and a steady test tone inside the window
+    start = last - tol
+    if start < 0 or last + tol + 2 > iIa.size: return None
+    x = iIa[start:last+tol+2] - 1j * iQa[start:last+tol+2]
+    mag = np.abs(x)
+    if mag.min() < 0.5 * mag.max(): return None
+    anglea = np.angle(x,deg=True) + 180
+    deltaaa = (anglea[1:] - anglea[:-1]) % 360
+    steps = np.nonzero( (deltaaa > 90) & (deltaaa < 270) )[0]
+    if steps.size != 1: return None
+    return start + steps[0], PhaseStepConfidence(deltaaa,steps[0]), float(start + steps[0])
+
+def Chirp(samples,Sr,amp,bandwidth=0.8):
+  """Return a Complex Linear Chirp Probe Sweeping bandwidth Times the Sample Rate Centered on 0 Hz"""
+  t = np.arange(samples) / float(Sr)
+  f0 = -0.5 * bandwidth * Sr
+  rate = bandwidth * Sr / (samples / float(Sr))
+  return (amp * np.exp(2j*np.pi*((f0*t) + (0.5*rate*t*t)))).astype(np.complex64)
+
+def ProbeLatency(iIa,iQa,probe,confidence):
+  """Locate a Probe Sent at Frame 0 by Correlation, Return the Round Trip Latency in Frames and Confidence"""
+  x = iIa - 1j * iQa
+  lags = x.size - probe.size + 1
+  if lags < 1:
+    raise IndexError("Capture is shorter than the latency probe")
+
+  nfft = 1 << int(np.ceil(np.log2(x.size + probe.size)))
+  c = np.abs(np.fft.ifft(np.fft.fft(x,nfft) * np.conj(np.fft.fft(probe,nfft)))[:lags])
+  lag = int(np.argmax(c))
+
+  ## A chirp correlates to a single sharp peak, whatever the reflection of the DUT
+  xe = np.sum(np.abs(x[lag:lag+probe.size])**2)
+  conf = c[lag] / np.sqrt(xe * np.sum(np.abs(probe)**2)) if xe > 0 else 0.0
+  if conf < confidence:
+    raise IndexError("Latency probe not found, confidence %.2f. Check levels or increase latencymax." % conf)
+  return lag, conf
+
+def DFTKernel(tonebins,fftn,window=None):
+  """Return the Windowed Complex Exponentials for the Test Tone Bins"""
+  kernel = np.exp(-2j*np.pi*np.outer(tonebins,np.arange(fftn))/fftn)
+  if window is not None: kernel *= window
+  return kernel
+
+def DFTReadings(I,Q,kernel,averages):
+  """Return the Mean and Variance over the FFT Windows of the Test Tone Readings"""
+  k = kernel.T
+  fftn = k.shape[0]
+  ## One row of tone readings per FFT window
+  I = I.reshape(averages,fftn)
+  Q = Q.reshape(averages,fftn)
+  windows = np.dot(I,k) - 1j * np.dot(Q,k)
+  ## Tones sit on whole bins so the windows are coherent and average directly
+  return windows.mean(axis=0), windows.var(axis=0)
+
+
+def ReplayParams(settings,**overrides):
+  """Return the Parameters for ProcessCapture from Recorded Settings"""
+  p = dict(settings)
+  ## The recorded sync settings are used unless overridden, older recordings lack them
+  p.setdefault('syncmode',config.syncmode)
+  p.setdefault('syncconfidence',config.syncconfidence)
+  p['window'] = 'hanning'
+  p.update(overrides)
+  fftbin = int(round((p['freq']/p['Sr'])*p['fftn']))
+  p['tonebins'], p['tonespacing'], p['tonephases'] = ToneLayout(fftbin,p['fftn'],p['Sr'],p['tones'],p['tonestep'])
+  return p
+
+def ProcessCapture(iIa,iQa,p,cache):
+  """Sync and Detect One Capture, Return Sync Index, Readings and Reading Variance
+
+  cache is a dictionary for the template and kernel, reused across captures with the same p."""
+  if 'kernel' not in cache:
+    n = p['rtframes2sync'] + p['sync2fft']
+    oIa, oQa = Stimulus(p['freq'],n,1.0/p['Sr'],p['amp'],p['tonespacing'],p['tonephases'],p['rtframes2sync'],p['sync2fft'])
+    cache['template'] = (oIa + 1j * oQa).astype(np.complex64)
+    cache['templatefft'] = {}
+    window = getattr(np,p['window'])(p['fftn']) if p['window'] else None
+    cache['kernel'] = DFTKernel(p['tonebins'],p['fftn'],window)
+
+  if p['syncmode'] == 'xcorr':
+    synci = SyncXCorr(iIa,iQa,cache['template'],p['minrtframes'],p['rtframes2sync'],p['syncconfidence'],cache['templatefft'])[0]
+  else:
+    synci = SyncPhase(iIa,iQa,p['minrtframes'],p['rtframes2sync'])[0]
+
+  start = synci + p['sync2fft']
+  end = start + (p['averages']*p['fftn'])
+  if iIa.size < end:
+    raise IndexError("Jack arrays are not long enough and/or bad sync. Resize arrays.")
+  readings, readingvar = DFTReadings(iIa[start:end],iQa[start:end],cache['kernel'],p['averages'])
+  return synci, readings, readingvar
+
+
+## Per process state of the batch replay pool
+_batch = {}
+
+def _BatchInit(fn,p):
+  _batch['recording'] = Recording(fn)
+  _batch['p'] = p
+  _batch['cache'] = {}
+
+def _BatchChunk(ks):
+  rec = _batch['recording']
+  results = []
+  for k in ks:
+    iIa, iQa = rec.Capture(k)
+    try:
+      synci, readings, readingvar = ProcessCapture(iIa,iQa,_batch['p'],_batch['cache'])
+    except (IndexError, ValueError):
+      synci, readings = None, None
+    results.append((k,synci,readings))
+  return results
+
+def BatchReplay(fn,processes=None,chunk=64,**overrides):
+  """Reprocess a Recording on All Cores and Return a Measurement
+
+  Every process memory maps the same recording, so the samples are shared through
+  the page cache rather than copied. overrides replace recorded parameters, for
+  example syncmode, syncconfidence or window. Points of captures that cannot be
+  reprocessed are NaN and the capture numbers are listed in the failed attribute
+  of the Measurement."""
+  rec = Recording(fn)
+  p = ReplayParams(rec.settings,**overrides)
+  m = rec.NewMeasurement()
+  failed = []
+
+  chunks = [list(range(k,min(k+chunk,len(rec)))) for k in range(0,len(rec),chunk)]
+  pool = multiprocessing.Pool(processes,_BatchInit,(fn,p))
+  try:
+    for results in pool.imap_unordered(_BatchChunk,chunks):
+      for k, synci, readings in results:
+        e = rec.index[k]
+        array = getattr(m,e['tag'])
+        if readings is None:
+          failed.append(k)
+          for i in e['indices']:
+            array[i] = complex(np.nan,np.nan)
+          continue
+        for j, i in enumerate(e['indices']):
+          array[i] = readings[j]
+  finally:
+    pool.close()
+    pool.join()
+
+  if failed: print("Could not reprocess",len(failed),"of",len(rec),"captures")
+  m.failed = sorted(failed)
+  return m
@@ -0,0 +1,116 @@
+# PySDRVNA Toolkit is a Python toolkit to use your Software Defined Radio
+# as a simple Vector Network Analyzer.
+# Copyright (c) 2013 by Steve Haynal, KF7O.
+
+# PySDRVNA Toolkit is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3.
+
+# PySDRVNA Toolkit is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License at <http://www.gnu.org/licenses/> for details.
+
+## Progress records posted by the measurement loop are formatted and written
+## by a background thread, so terminal or file I/O never stalls a capture.
+## A sink is any callable taking a record dictionary.
+
+from __future__ import print_function
+import numpy as np
+import json, threading, time
+
+try:
+  import queue
+except ImportError:
+  import Queue as queue
+
+
+def Format(record):
+  """Format a Record as a Line of Text"""
+  kind = record['kind']
+  if kind == 'point':
+    s = "%d " % record['index'] if record.get('index') is not None else ""
+    cn = record['reading']
+    s += "Sync:%d Freq:%d " % (record['synci'],int(round(record['freq'])))
+    s += "Real:%3.2f Imag:%3.2f Mag:%3.2f " % (cn.real,cn.imag,np.abs(cn))
+    if record.get('std') is not None: s += "Std:%3.2f " % record['std']
+    s += "Phase:%3.2f" % np.angle(cn,deg=True)
+    return s
+  elif kind == 'swr':
+    return '{:>9.6f} MHz SWR:{:>2.2f}'.format(record['freq'],record['swr'])
+  return str(record.get('text',''))
+
+
+class ConsoleSink:
+  """Print Each Record"""
+  def __call__(self,record):
+    print(Format(record))
+
+
+class FileSink:
+  """Append Each Record to a File as a Line of JSON"""
+  def __init__(self,fn):
+    self.f = open(fn,'a')
+
+  @staticmethod
+  def Encode(x):
+    if isinstance(x,(complex,np.complexfloating)): return [float(x.real),float(x.imag)]
+    if isinstance(x,np.generic): return x.item()
+    return str(x)
+
+  def __call__(self,record):
+    self.f.write(json.dumps(record,default=self.Encode)+"\n")
+
+  def Flush(self):
+    self.f.flush()
+
+
+class Progress:
+
+  def __init__(self,sinks=None,size=1024,printlevel=1):
+    """Start the Background Thread Writing Records to the Sinks"""
+    self.sinks = [ConsoleSink()] if sinks is None else list(sinks)
+    self.printlevel = printlevel
+    self.queue = queue.Queue(size)
+    self.dropped = 0
+    self.errors = 0
+    self.thread = threading.Thread(target=self.Run)
+    self.thread.daemon = True
+    self.thread.start()
+
+  def AddSink(self,sink):
+    """Add a Sink, Any Callable Taking a Record Dictionary"""
+    self.sinks.append(sink)
+
+  def Post(self,kind,level=1,**record):
+    """Queue a Record if level is Within printlevel, Never Blocks"""
+    if level > self.printlevel: return
+    record['kind'] = kind
+    record['time'] = time.time()
+    try:
+      self.queue.put_nowait(record)
+    except queue.Full:
+      self.dropped += 1
+
+  def Message(self,*args,**kwargs):
+    """Queue a Text Message Formatted like print"""
+    self.Post('message',kwargs.get('level',0),text=" ".join(str(a) for a in args))
+
+  def Run(self):
+    while True:
+      record = self.queue.get()
+      for sink in self.sinks:
+        try:
+          sink(record)
+        except Exception:
+          self.errors += 1
+      self.queue.task_done()
+
+  def Flush(self):
+    """Wait Until All Queued Records are Written"""
+    self.queue.join()
+    for sink in self.sinks:
+      if hasattr(sink,'Flush'): sink.Flush()
+    if self.dropped:
+      print("Progress queue full,",self.dropped,"records dropped")
+      self.dropped = 0
@@ -0,0 +1,215 @@
+# PySDRVNA Toolkit is a Python toolkit to use your Software Defined Radio
+# as a simple Vector Network Analyzer.
+# Copyright (c) 2013 by Steve Haynal, KF7O.
+
+# PySDRVNA Toolkit is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3.
+
+# PySDRVNA Toolkit is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License at <http://www.gnu.org/licenses/> for details.
+
+## Raw capture recording and replay.
+## A recording is two files: fn.vrr holds the float32 I and Q samples of every
+## capture back to back and fn.vri holds the pickled settings followed by one pickled
+## index entry per capture, with settings updates such as the sweep frequencies between
+## them. Captures that failed to sync are recorded too, with synci None, so they can be
+## resynchronized offline. Both files are written as each capture is recorded, so a
+## recording cut short by a crash can still be replayed up to the last capture.
+
+from __future__ import print_function
+import numpy as np
+import ctypes, pickle, time, os
+
+from Measurement import *
+import config
+
+
+class CaptureRecorder:
+
+  def __init__(self,fn,settings):
+    """Start a New Recording of Raw Captures"""
+    self.fn = fn
+    self.settings = settings
+    self.index = []
+    self.offset = 0
+    self.raw = open(fn+".vrr", 'wb')
+    self.vri = open(fn+".vri", 'wb')
+    pickle.dump( settings, self.vri )
+    self.vri.flush()
+
+  def Append(self,iIa,iQa,freq,synci,tag,indices):
+    """Append a Capture Taken with the First Tone at freq Hz for Frequency indices of a Measurement Array"""
+    self.raw.write(np.ascontiguousarray(iIa,dtype=np.float32).tobytes())
+    self.raw.write(np.ascontiguousarray(iQa,dtype=np.float32).tobytes())
+    self.raw.flush()
+    e = {'offset':self.offset, 'size':iIa.size, 'freq':freq, 'synci':synci,
+         'time':time.time(), 'tag':tag, 'indices':list(indices)}
+    self.index.append(e)
+    ## Samples first so an index entry never refers to samples that were not written
+    pickle.dump( e, self.vri )
+    self.vri.flush()
+    self.offset += 2*iIa.size
+
+  def UpdateSettings(self,**settings):
+    """Record Settings that Change during the Recording, the Last Value Wins on Replay"""
+    self.settings.update(settings)
+    pickle.dump( {'settings':settings}, self.vri )
+    self.vri.flush()
+
+  def Flush(self):
+    """Write the Samples and Index Recorded so Far"""
+    self.raw.flush()
+    self.vri.flush()
+
+  def Close(self):
+    """Finish the Recording"""
+    self.Flush()
+    self.raw.close()
+    self.vri.close()
+
+
+class Recording:
+
+  def __init__(self,fn):
+    """Open a Recording, the Samples are Memory Mapped"""
+    self.fn = fn
+    pf = open(fn+".vri", 'rb')
+    self.settings = pickle.load(pf)
+    self.index = []
+    while True:
+      try:
+        e = pickle.load(pf)
+      except (EOFError, pickle.UnpicklingError):
+        ## End of the index, or an entry cut short by a crash
+        break
+      if 'settings' in e:
+        self.settings.update(e['settings'])
+      else:
+        self.index.append(e)
+    pf.close()
+    if os.path.getsize(fn+".vrr") > 0:
+      self.raw = np.memmap(fn+".vrr", dtype=np.float32, mode='r')
+    else:
+      self.raw = np.zeros(0, dtype=np.float32)
+    self.index = [e for e in self.index if e['offset'] + (2*e['size']) <= self.raw.size]
+
+  def __len__(self):
+    return len(self.index)
+
+  def Capture(self,k):
+    """Return the I and Q Arrays of Capture k"""
+    e = self.index[k]
+    iIa = self.raw[e['offset']:e['offset']+e['size']]
+    iQa = self.raw[e['offset']+e['size']:e['offset']+(2*e['size'])]
+    return iIa, iQa
+
+  def NewMeasurement(self):
+    """Create an Empty Measurement for the Frequencies in the Recording"""
+    if 'sweepfreq' in self.settings:
+      return Measurement(list(self.settings['sweepfreq']))
+    ## Recordings without sweep frequencies only know the points that were captured
+    n = max(max(e['indices']) for e in self.index) + 1
+    freq = np.zeros(n)
+    for e in self.index:
+      for j, i in enumerate(e['indices']):
+        freq[i] = (e['freq'] + (j*self.settings['tonespacing'])) / 1.0e6
+    return Measurement(list(freq))
+
+
+def ReplayConfig(fn,**overrides):
+  '''Return a VNA Configuration that Replays a Recording with its Recorded Settings'''
+  configd = dict(config.__dict__)
+  settings = Recording(fn).settings
+  for k in ['fftn','freq','amp','tones','tonestep','averages','rtframes','rtframes2sync','sync2fft','fft2end']:
+    configd[k] = settings[k]
+  ## Older recordings lack the sync settings
+  for k in ['syncmode','syncconfidence']:
+    if k in settings: configd[k] = settings[k]
+  configd['backend'] = 'replay'
+  configd['replay'] = fn
+  configd.update(overrides)
+  return configd
+
+
+class ReplayJack:
+  """Stand-in for jacklib with the Recorded Sample Rate, Buffer Size and Latency
+
+  No Jack periods ever run, captures come from the recording through VNA.Replay."""
+
+  JackSessionID = 0x00
+  JackPortIsInput = 0x1
+  JackPortIsOutput = 0x2
+  JackCaptureLatency = 0
+  JackPlaybackLatency = 1
+  JACK_DEFAULT_AUDIO_TYPE = "32 bit float mono audio"
+  jack_default_audio_sample_t = ctypes.c_float
+
+  class jack_latency_range_t:
+    min = 0
+    max = 0
+
+  def __init__(self,configd):
+    self.settings = Recording(configd['replay']).settings
+    self.softrock = None
+
+  @property
+  def contents(self):
+    return self
+
+  def client_open(self,client_name,options,status,uuid=""):
+    return self
+
+  def client_close(self,client):
+    pass
+
+  def port_register(self,client,port_name,port_type,flags,buffer_size):
+    return port_name
+
+  def port_get_buffer(self,port,nframes):
+    return None
+
+  def port_get_latency_range(self,port,mode,range_):
+    ## Split so the sum is the recorded minimum round trip
+    if mode == self.JackPlaybackLatency:
+      range_.min = range_.max = self.settings['minrtframes'] // 2
+    else:
+      range_.min = range_.max = self.settings['minrtframes'] - (self.settings['minrtframes'] // 2)
+
+  def set_process_callback(self,client,process_callback,arg):
+    return 0
+
+  def set_process_thread(self,client,thread_callback,arg):
+    return 0
+
+  def cycle_wait(self,client):
+    return 0
+
+  def cycle_signal(self,client,status):
+    pass
+
+  def set_xrun_callback(self,client,xrun_callback,arg):
+    return 0
+
+  def set_buffer_size_callback(self,client,bufsize_callback,arg):
+    return 0
+
+  def set_sample_rate_callback(self,client,srate_callback,arg):
+    return 0
+
+  def connect(self,client,source_port,destination_port):
+    return 0
+
+  def get_sample_rate(self,client):
+    return self.settings['Sr']
+
+  def get_buffer_size(self,client):
+    return self.settings['buffersz']
+
+  def activate(self,client):
+    return 0
+
+  def deactivate(self,client):
+    return 0
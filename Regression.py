@@ -0,0 +1,396 @@
+# PySDRVNA Toolkit is a Python toolkit to use your Software Defined Radio
+# as a simple Vector Network Analyzer.
+# Copyright (c) 2013 by Steve Haynal, KF7O.
+
+# PySDRVNA Toolkit is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3.
+
+# PySDRVNA Toolkit is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License at <http://www.gnu.org/licenses/> for details.
+
+## Regression checks run against the simulated backend, no sound card or SoftRock needed.
+## Run with python -m unittest Regression
+
+from __future__ import print_function
+import numpy as np
+import unittest, tempfile, shutil, os, asyncio, threading
+
+from VNA import *
+from Si570 import Registers, PackRegisters, RegistersToFreq
+from Recorder import ReplayConfig, Recording
+from AsyncVNA import AsyncVNA
+import DSP
+import config
+
+
+def SimConfig(**overrides):
+  '''Return a Simulated VNA Configuration without Warmup or Cooldown Delays'''
+  configd = dict(config.__dict__)
+  configd['backend'] = 'sim'
+  configd['simspeed'] = 10.0
+  configd['warmuptime'] = 0.01
+  configd['cooldowntime'] = 0.0
+  configd['printlevel'] = 0
+  configd['latencycache'] = None
+  configd.update(overrides)
+  return configd
+
+def SweepFreq(n=12,step=0.01):
+  '''Return n Frequencies in MHz from 14 MHz'''
+  return list(14.0 + step*np.arange(n))
+
+def Ramp(f):
+  '''Simulated DUT Impedance that Changes with Frequency'''
+  return 25 + 1j*(f-14.0e6)/1e4
+
+
+class Si570Tests(unittest.TestCase):
+
+  def testRegistersRoundTrip(self):
+    '''Packed Registers Unpack to the Running Frequency within the RFREQ Resolution'''
+    for freq in np.linspace(3.5e6,30.0e6,97):
+      s = PackRegisters(Registers(freq))
+      self.assertLess(abs(RegistersToFreq(s) - freq), 1.0)
+
+  def testOutOfRange(self):
+    self.assertIsNone(Registers(0.0))
+    self.assertIsNone(Registers(1.0e3))
+
+
+class SimTests(unittest.TestCase):
+
+  def setUp(self):
+    self.vna = None
+
+  def tearDown(self):
+    if self.vna is not None: self.vna.Close()
+
+  def Open(self,**overrides):
+    self.vna = VNA(SimConfig(**overrides))
+    return self.vna
+
+  def Sweep(self,freq,plan=None):
+    a = np.zeros(len(freq),dtype=complex)
+    self.vna.M2Array(freq,a,plan)
+    return a
+
+  def Calibrated(self,n=9,tol=0.05,**overrides):
+    '''Measure the Ramp DUT with Open, Short and Load, Check Z and Return the Measurement'''
+    vna = self.Open(**overrides)
+    sim = vna.jack
+    ## Consecutive frequencies one tone spacing apart share a capture
+    step = vna.tonespacing/1.0e6 if vna.tones > 1 else 0.005
+    m = Measurement(SweepFreq(n,step))
+    sim.SetDUT(None); vna.MO(m)
+    sim.SetDUT(0); vna.MS(m)
+    sim.SetDUT(50+0j); vna.ML(m)
+    sim.SetDUT(Ramp); vna.MD(m)
+    self.assertFalse(vna.failed)
+    self.assertLess(np.max(np.abs(m.Z()-Ramp(m.freq*1.0e6))), tol)
+    return m
+
+  def testCallback(self):
+    self.Calibrated()
+
+  def testStreaming(self):
+    self.Calibrated(streaming=True)
+    self.assertTrue(self.vna.streaming)
+    self.assertGreater(self.vna.ringframes,0)
+
+  def testThreadStreaming(self):
+    self.Calibrated(streaming=True,processmode='thread')
+
+  def testTones(self):
+    '''Three Test Tones per Capture Measure Three Frequencies'''
+    m = self.Calibrated(tol=0.25,tones=3)
+    self.assertEqual(self.vna.stats['xruns'],0)
+    self.assertEqual(len(list(self.vna.SweepSteps(m.freq))),3)
+
+  def testXCorrTrack(self):
+    '''Correlation Sync, then Tracking Finds the Sync Index Near the Last One'''
+    self.Calibrated(syncmode='xcorr',synctrack=True)
+    self.assertGreater(self.vna.synchits,0)
+    self.assertEqual(self.vna.syncmisses,0)
+
+  def testAverages(self):
+    vna = self.Open()
+    size = vna.iIa.size
+    vna.NewAverages(4)
+    ## The loose fit of an estimated rtframes is kept
+    self.assertTrue(vna.autortframes)
+    self.assertEqual(vna.iIa.size,size + 3*vna.fftn)
+    vna.Close()
+    self.Calibrated(averages=4)
+    self.assertTrue(np.all(np.isfinite(self.vna.readingvar)))
+
+  def testTiming(self):
+    '''Every Capture of a Sweep has a Capture and FFT Stage Time'''
+    self.Calibrated(timing=64)
+    d = self.vna.TimingDurations()
+    self.assertEqual(d.shape[0],4*9)
+    for stage in ['capture','fft']:
+      self.assertTrue(np.all(d[:,TIMINGSTAGES.index(stage)] >= 0))
+
+  def testProgressSinks(self):
+    '''One Point Record per Test Tone Reaches the Sinks'''
+    vna = self.Open(tones=3)
+    records = []
+    vna.progress.sinks = [records.append]
+    vna.printlevel = vna.progress.printlevel = 1
+    freq = SweepFreq(9,vna.tonespacing/1.0e6)
+    self.Sweep(freq)
+    vna.progress.Flush()
+    points = [r for r in records if r['kind'] == 'point']
+    self.assertEqual(len(points),9)
+    for f, r in zip(freq,points):
+      self.assertAlmostEqual(r['freq'],f*1.0e6,delta=vna.Sr/vna.fftn)
+
+  def testCalibrateLatency(self):
+    '''The Chirp Probe Measures the Simulated Round Trip and the Arrays Fit it Tightly'''
+    vna = self.Open()
+    vna.CalibrateLatency(measure=True)
+    self.assertEqual(vna.rtframes,vna.jack.latency)
+    self.assertFalse(vna.autortframes)
+    self.assertEqual(vna.iIa.size,vna.ArrayLength())
+    self.assertFalse(np.isnan(self.Sweep(SweepFreq(4))).any())
+
+  def CheckInterrupt(self,pipeline):
+    vna = self.Open(pipeline=pipeline)
+    threads = threading.active_count()
+    capture = vna.Capture
+    captures = [0]
+    def Capture():
+      captures[0] += 1
+      if captures[0] == 3: raise KeyboardInterrupt()
+      capture()
+    vna.Capture = Capture
+    with self.assertRaises(KeyboardInterrupt):
+      self.Sweep(SweepFreq())
+    ## The transmitter is unkeyed and the pipeline worker stopped
+    self.assertEqual(vna.jack.softrock.ptt,0)
+    self.assertEqual(threading.active_count(),threads)
+
+  def testInterrupt(self):
+    self.CheckInterrupt(False)
+
+  def testInterruptPipelined(self):
+    self.CheckInterrupt(True)
+
+  def testScheduleIndices(self):
+    '''A Scheduled Plan Visits Every Frequency Once and Stores Readings at the Original Indices'''
+    vna = self.Open()
+    vna.jack.SetDUT(Ramp)
+    freq = SweepFreq()
+    shuffled = list(np.random.RandomState(0).permutation(freq))
+    plan = vna.CompilePlan(shuffled,True)
+    visited = sorted(i for f, indices in plan.steps for i in indices)
+    self.assertEqual(visited,list(range(len(shuffled))))
+    for f, indices in plan.steps:
+      for j, i in enumerate(indices):
+        self.assertAlmostEqual(shuffled[i]*1.0e6, f + j*vna.tonespacing, delta=vna.Sr/vna.fftn)
+        self.assertEqual(plan.bins[i],vna.tonebins[j])
+    a = self.Sweep(shuffled,plan)
+    b = self.Sweep(freq)
+    order = [freq.index(f) for f in shuffled]
+    self.assertTrue(np.allclose(a,b[order],rtol=0.02))
+
+  def testSmoothCenter(self):
+    '''Points Near the Running Frequency Settle, Phase Stays Consistent Across the Sweep'''
+    vna = self.Open()
+    ## The first retune is within the smooth tune range of the running frequency
+    self.assertEqual(vna.smoothcenter,vna.lofreq)
+    a = self.Sweep(SweepFreq())
+    self.assertFalse(np.isnan(a).any())
+    self.assertLess(np.max(np.abs(np.angle(a/a[0],deg=True))), 5.0)
+
+  def testResizeNeverShrinks(self):
+    '''Sync Failures from a Round Trip Longer than the Arrays Grow them, Never Shrink'''
+    vna = self.Open(syncmode='xcorr',syncresizemax=3)
+    sim = vna.jack
+    extra = 1300
+    sim.pending = np.concatenate([np.zeros(extra,dtype=np.complex64),sim.pending])
+    sim.latency += extra
+    size = vna.iIa.size
+    a = self.Sweep(SweepFreq(6,0.001))
+    self.assertGreaterEqual(vna.iIa.size,size)
+    self.assertGreater(vna.stats['resizes'],0)
+    self.assertFalse(np.isnan(a).any())
+
+  def testResizeCap(self):
+    '''Resizes Stop at syncresizemax when Sync Can Never Succeed'''
+    vna = self.Open(syncmode='xcorr',syncresizemax=3)
+    vna.jack.gain = 0
+    size = vna.iIa.size
+    self.Sweep(SweepFreq(6,0.001))
+    self.assertGreaterEqual(vna.iIa.size,size)
+    self.assertEqual(vna.stats['resizes'],3)
+
+  def CheckRetune(self,pipeline):
+    vna = self.Open(pipeline=pipeline)
+    sim = vna.jack
+    vna.M(14000000)
+    sim.SetSampleRate(44100)
+    vna.M(14100000)
+    ## The LO follows the test tone moved by the sample rate change
+    self.assertAlmostEqual(vna.LOFreq()+vna.freq, 14100000, delta=1.0)
+    freq = SweepFreq()
+    plan = vna.CompilePlan(freq)
+    ref = self.Sweep(freq,plan)
+    ## Change the sample rate partway through the sweep
+    captures = [0]
+    def CoolDown():
+      captures[0] += 1
+      if captures[0] == 4: sim.SetSampleRate(48000)
+    vna.DoCoolDown = CoolDown
+    a = self.Sweep(freq,plan)
+    self.assertEqual(vna.Sr,48000)
+    self.assertAlmostEqual(vna.LOFreq()+vna.freq, freq[-1]*1.0e6, delta=1.0)
+    self.assertTrue(np.allclose(a,ref,rtol=0.02))
+
+  def testRetuneAfterSampleRate(self):
+    self.CheckRetune(False)
+
+  def testRetuneAfterSampleRatePipelined(self):
+    self.CheckRetune(True)
+
+  def testAsyncRetuneAfterSampleRate(self):
+    vna = self.vna = AsyncVNA(SimConfig())
+    async def Run():
+      await vna.MAsync(14000000)
+      vna.jack.SetSampleRate(44100)
+      await vna.MAsync(14100000)
+    asyncio.run(Run())
+    self.assertAlmostEqual(vna.LOFreq()+vna.freq, 14100000, delta=1.0)
+
+  def testAsyncCancelCapture(self):
+    '''A Cancelled Capture is Abandoned, so the Arrays can be Replaced'''
+    vna = self.vna = AsyncVNA(SimConfig(simspeed=1.0,warmuptime=0.0))
+    async def Run():
+      for k in range(10):
+        try:
+          await asyncio.wait_for(vna.Measure(14000000),0.005+0.002*k)
+        except asyncio.TimeoutError:
+          pass
+        self.assertTrue(vna.docapture.is_set())
+        vna.NewAmp(0.5+0.01*k)
+      return await vna.Measure(14000000)
+    self.assertFalse(np.isnan(asyncio.run(Run())))
+
+  def testAsyncCancelReleasesPTT(self):
+    vna = self.vna = AsyncVNA(SimConfig(simspeed=1.0,warmuptime=0.2))
+    async def Run():
+      try:
+        await asyncio.wait_for(vna.Measure(14000000),0.02)
+      except asyncio.TimeoutError:
+        pass
+    asyncio.run(Run())
+    self.assertEqual(vna.jack.softrock.ptt,0)
+
+
+class ReplayTests(unittest.TestCase):
+
+  @classmethod
+  def setUpClass(cls):
+    '''Record One Calibrated Measurement'''
+    cls.dir = tempfile.mkdtemp()
+    cls.fn = os.path.join(cls.dir,'rec')
+    vna = VNA(SimConfig())
+    sim = vna.jack
+    cls.m = Measurement(14.0,14.05,0.005)
+    vna.StartRecording(cls.fn)
+    try:
+      sim.SetDUT(None); vna.MO(cls.m)
+      sim.SetDUT(0); vna.MS(cls.m)
+      sim.SetDUT(50+0j); vna.ML(cls.m)
+      sim.SetDUT(Ramp); vna.MD(cls.m)
+    finally:
+      vna.StopRecording()
+      vna.Close()
+
+  @classmethod
+  def tearDownClass(cls):
+    shutil.rmtree(cls.dir)
+
+  def Replay(self,**overrides):
+    vna = VNA(ReplayConfig(self.fn,printlevel=0,**overrides))
+    try:
+      return vna.Replay(self.fn)
+    finally:
+      vna.Close()
+
+  def testReplay(self):
+    '''Replaying the Recording Reproduces the Measurement Exactly'''
+    m = self.Replay()
+    self.assertTrue(np.allclose(m.freq,self.m.freq))
+    self.assertEqual(np.max(np.abs(m.Z()-self.m.Z())),0.0)
+
+  def testBatchReplay(self):
+    m = DSP.BatchReplay(self.fn,processes=1,chunk=4)
+    self.assertTrue(np.allclose(m.Z(),self.m.Z(),rtol=1e-9))
+
+  def testReplayFailure(self):
+    '''Captures that Cannot be Synchronized Replay as NaN'''
+    m = self.Replay(syncmode='xcorr',syncconfidence=2.0)
+    self.assertTrue(np.isnan(m.dut).all())
+    m = DSP.BatchReplay(self.fn,processes=1,syncmode='xcorr',syncconfidence=2.0)
+    self.assertTrue(np.isnan(m.dut).all())
+    self.assertEqual(len(m.failed),len(Recording(self.fn)))
+
+  def testDetectors(self):
+    '''The Single Bin DFT Detector Matches the FFT Detector'''
+    m = self.Replay(detector='dft')
+    self.assertTrue(np.allclose(m.Z(),self.m.Z(),rtol=1e-9))
+
+
+class FailedCaptureTests(unittest.TestCase):
+
+  @classmethod
+  def setUpClass(cls):
+    '''Record a Sweep where the First and Last Two Captures Cannot Sync'''
+    cls.dir = tempfile.mkdtemp()
+    cls.fn = os.path.join(cls.dir,'rec')
+    vna = VNA(SimConfig(syncmode='xcorr',attempts=2))
+    sim = vna.jack
+    captures = [0]
+    def CoolDown():
+      captures[0] += 1
+      sim.gain = 0 if captures[0] in (1,4,5) else config.simgain
+    vna.DoCoolDown = CoolDown
+    cls.freq = SweepFreq(6)
+    cls.a = np.zeros(6,dtype=complex)
+    vna.StartRecording(cls.fn)
+    try:
+      vna.M2Array(cls.freq,cls.a)
+    finally:
+      vna.StopRecording()
+      vna.Close()
+
+  @classmethod
+  def tearDownClass(cls):
+    shutil.rmtree(cls.dir)
+
+  def testRecorded(self):
+    rec = Recording(self.fn)
+    self.assertEqual(len(rec),6)
+    self.assertEqual([e['synci'] is None for e in rec.index],[True,False,False,True,True,False])
+    self.assertEqual(rec.settings['sweepfreq'],self.freq)
+
+  def testReplay(self):
+    '''Failed Points Keep their Frequency and Replay as NaN with the Recorded Sync Mode'''
+    self.assertEqual(DSP.ReplayParams(Recording(self.fn).settings)['syncmode'],'xcorr')
+    vna = VNA(ReplayConfig(self.fn,printlevel=0))
+    try:
+      m = vna.Replay(self.fn)
+    finally:
+      vna.Close()
+    self.assertTrue(np.allclose(m.freq,self.freq))
+    self.assertTrue(np.array_equal(np.isnan(m.dut),np.isnan(self.a)))
+    m = DSP.BatchReplay(self.fn,processes=1)
+    self.assertEqual(m.failed,[0,3,4])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,118 @@
+# PySDRVNA Toolkit is a Python toolkit to use your Software Defined Radio
+# as a simple Vector Network Analyzer.
+# Copyright (c) 2013 by Steve Haynal, KF7O.
+
+# PySDRVNA Toolkit is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3.
+
+# PySDRVNA Toolkit is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License at <http://www.gnu.org/licenses/> for details.
+
+## Si570 register and USB payload computations, independent of the USB device
+
+from __future__ import print_function
+import struct, math
+
+#####
+## All si570 interface code is borrow directly from or based on QUISK. Thank you!
+#####
+
+# All USB access is through control transfers using pyusb.
+#   byte_array      = dev.ctrl_transfer (IN,  bmRequest, wValue, wIndex, length, timout)
+#   len(string_msg) = dev.ctrl_transfer (OUT, bmRequest, wValue, wIndex, string_msg, timout)
+# I2C-address of the SI570;  Thanks to Joachim Schneider, DB6QS
+si570_i2c_address = 0x55
+
+# Thanks to Ethan Blanton, KB8OJH, for this patch for the Si570 (many SoftRocks):
+# These are used by SetFreqByDirect(); see below.
+# The Si570 DCO must be clamped between these values
+SI570_MIN_DCO = 4.85e9
+SI570_MAX_DCO = 5.67e9
+# The Si570 has 6 valid HSDIV values.  Subtract 4 from HSDIV before
+# stuffing it.  We want to find the highest HSDIV first, so start
+# from 11.
+SI570_HSDIV_VALUES = [11, 9, 7, 6, 5, 4]
+
+si570_xtal_freq = 114251870
+
+UBYTE2 = struct.Struct('<H')
+UBYTE4 = struct.Struct('<L')    # Thanks to Sivan Toledo
+REGISTERS = struct.Struct('>BBL')
+
+
+def FreqToWord(freq):
+  """Pack a Running Frequency in Hz for the Set Frequency Command 0x32"""
+  return UBYTE4.pack(int(freq/1.0e6 * 2097152.0 * 4.0 + 0.5))
+
+def WordToFreq(s):
+  """Unpack a Running Frequency in Hz from the Get Frequency Commands 0x3A and 0x3C"""
+  freq = UBYTE4.unpack(s)[0]
+  return int(freq * 1.0e6 / 2097152.0 / 4.0 + 0.5)
+
+def Registers(freq): # Thanks to Ethan Blanton, KB8OJH
+  """Compute Stuffed HSDIV, N1 and RFREQ for a Running Frequency in Hz, None if Out of Range"""
+  if freq == 0.0:
+    return None
+  # For now, find the minimum DCO speed that will give us the
+  # desired frequency; if we're slewing in the future, we want this
+  # to additionally yield an RFREQ ~= 512.
+  freq = int(freq * 4)
+  dco_new = None
+  hsdiv_new = 0
+  n1_new = 0
+  for hsdiv in SI570_HSDIV_VALUES:
+    n1 = int(math.ceil(SI570_MIN_DCO / (freq * hsdiv)))
+    if n1 < 1:
+      n1 = 1
+    else:
+      n1 = ((n1 + 1) // 2) * 2
+    dco = (freq * 1.0) * hsdiv * n1
+    # Since we're starting with max hsdiv, this can only happen if
+    # freq was larger than we can handle
+    if n1 > 128:
+      continue
+    if dco < SI570_MIN_DCO or dco > SI570_MAX_DCO:
+      # This really shouldn't happen
+      continue
+    if not dco_new or dco < dco_new:
+      dco_new = dco
+      hsdiv_new = hsdiv
+      n1_new = n1
+  if not dco_new:
+    # For some reason, we were unable to calculate a frequency.
+    # Probably because the frequency requested is outside the range
+    # of our device.
+    return None
+  rfreq = dco_new / si570_xtal_freq
+  rfreq_int = int(rfreq)
+  rfreq_frac = int(round((rfreq - rfreq_int) * 2**28))
+  # n1 is stuffed as n1 - 1, hsdiv is stuffed as hsdiv - 4.
+  return hsdiv_new - 4, int(n1_new - 1), rfreq_int, rfreq_frac
+
+def PackRegisters(registers):
+  """Pack Stuffed Registers for the Write Registers Command 0x30"""
+  # It looks like the DG8SAQ protocol just passes r7-r12 straight
+  # To the Si570 when given command 0x30.  Easy enough.
+  hsdiv, n1, rfreq_int, rfreq_frac = registers
+  return REGISTERS.pack((hsdiv << 5) + (n1 >> 2),
+                        ((n1 & 0x3) << 6) + (rfreq_int >> 4),
+                        ((rfreq_int & 0xf) << 28) + rfreq_frac)
+
+def RetuneClass(freq,center,smoothtune):
+  """Classify a Retune to freq Given the Smooth Tune Center and Range in ppm
+
+  Returns the class, 'smooth' or 'jump', and the new smooth tune center."""
+  if center and abs(freq - center) <= (center * smoothtune * 1.0e-6):
+    return 'smooth', center
+  return 'jump', freq
+
+def RegistersToFreq(s):
+  """Unpack a Write Registers Payload into the Running Frequency in Hz"""
+  b0, b1, low = REGISTERS.unpack(s)
+  hsdiv = (b0 >> 5) + 4
+  n1 = (((b0 & 0x1f) << 2) | (b1 >> 6)) + 1
+  rfreq = (((b1 & 0x3f) << 4) | (low >> 28)) + (float(low & 0xfffffff) / 2**28)
+  return (rfreq * si570_xtal_freq) / (hsdiv * n1) / 4.0
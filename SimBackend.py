@@ -0,0 +1,328 @@
+# PySDRVNA Toolkit is a Python toolkit to use your Software Defined Radio
+# as a simple Vector Network Analyzer.
+# Copyright (c) 2013 by Steve Haynal, KF7O.
+
+# PySDRVNA Toolkit is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3.
+
+# PySDRVNA Toolkit is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License at <http://www.gnu.org/licenses/> for details.
+
+## Simulated Jack server and SoftRock so a VNA runs without a sound card or radio.
+## SimJack provides the subset of jacklib used by VNA and SimSoftRock the subset of
+## the pyusb device, so the same JackProcess, M, Sync and DoFFT code runs against them.
+
+from __future__ import print_function
+import numpy as np
+import array, ctypes, threading, time
+
+from Si570 import *
+
+
+class SimLatencyRange:
+  """Stand-in for jacklib.jack_latency_range_t"""
+  def __init__(self):
+    self.min = 0
+    self.max = 0
+
+
+class SimPort:
+  """Simulated Jack Port with its Own Sample Buffer"""
+  def __init__(self,name,flags,buffersz):
+    self.name = name
+    self.flags = flags
+    self.buffer = np.zeros(buffersz, dtype=np.float32)
+
+
+class SimSoftRock:
+  """Simulated SoftRock Answering the USB Control Transfers Used by VNA"""
+
+  def __init__(self,configd):
+    self.startupfreq = configd['simstartupfreq']
+    self.lo = float(self.startupfreq)
+    self.smoothtune = 3500
+    self.smoothcenter = self.lo
+    self.settletime = configd['simsettletime']
+    self.settleuntil = 0.0
+    self.settledrift = configd['simsettledrift']
+    self.ptt = 0
+    self.transfers = 0
+
+  def set_configuration(self):
+    pass
+
+  def Retune(self,lo,rc=None):
+    """Change the LO and Start Settling According to the Kind of Retune"""
+    if rc is None:
+      rc, self.smoothcenter = RetuneClass(lo,self.smoothcenter,self.smoothtune)
+    else:
+      self.smoothcenter = lo
+    self.lo = lo
+    self.settleuntil = time.time() + self.settletime[rc]
+
+  def Phase(self,t):
+    """Extra Phase in Radians of the LO at Time t While it Settles"""
+    if t >= self.settleuntil: return 0.0
+    return 2*np.pi*self.settledrift*(self.settleuntil - t)
+
+  def ctrl_transfer(self,bmRequestType,bRequest,wValue=0,wIndex=0,data_or_wLength=None,timeout=None):
+    self.transfers += 1
+    if bRequest == 0x00:
+      return array.array('B',[0x0F,0x01])
+    elif bRequest == 0x3C:
+      return array.array('B',FreqToWord(self.startupfreq))
+    elif bRequest == 0x3A:
+      return array.array('B',FreqToWord(self.lo))
+    elif bRequest == 0x41:
+      return array.array('B',[si570_i2c_address])
+    elif bRequest == 0x3B:
+      return array.array('B',UBYTE2.pack(self.smoothtune))
+    elif bRequest == 0x32:
+      self.Retune(WordToFreq(bytearray(data_or_wLength)))
+      return len(data_or_wLength)
+    elif bRequest == 0x30:
+      self.Retune(RegistersToFreq(bytes(bytearray(data_or_wLength))),'jump')
+      return len(data_or_wLength)
+    elif bRequest == 0x50:
+      self.ptt = wValue
+      return array.array('B',[0,0,0])
+    raise ValueError("Simulated SoftRock does not support request 0x%X" % bRequest)
+
+
+class SimJack:
+  """Simulated Jack Server Looping the VNA Output Back Through a Simulated DUT
+
+  The stimulus returns to the inputs after simlatency frames, scaled by the
+  reflection coefficient of the DUT at the LO plus test tone frequency plus
+  the leakage of an imperfect bridge, with
+  the settling phase of the SoftRock and Gaussian noise added. The reflection
+  coefficient is evaluated at one frequency per period, which is accurate as
+  long as the DUT changes little over the audio bandwidth of the test tones."""
+
+  JackSessionID = 0x00
+  JackPortIsInput = 0x1
+  JackPortIsOutput = 0x2
+  JackCaptureLatency = 0
+  JackPlaybackLatency = 1
+  JACK_DEFAULT_AUDIO_TYPE = "32 bit float mono audio"
+  jack_default_audio_sample_t = ctypes.c_float
+  jack_latency_range_t = SimLatencyRange
+
+  def __init__(self,configd):
+    self.Sr = configd['simsr']
+    self.buffersz = configd['simbuffersz']
+    ## The round trip is never shorter than one period
+    self.latency = max(configd['simlatency'],self.buffersz)
+    self.noise = configd['simnoise']
+    self.gain = configd['simgain']
+    self.leakage = configd['simleakage']
+    self.xrunprob = configd['simxrunprob']
+    self.speed = configd['simspeed']
+    self.feedlinez = configd['feedlinez']
+    self.tonefreq = configd['freq']
+    self.dutz = configd['simdutz']
+
+    self.softrock = SimSoftRock(configd)
+    self.ports = {}
+    self.process_callback = None
+    self.thread_callback = None
+    self.xrun_callback = None
+    self.buffer_size_callback = None
+    self.sample_rate_callback = None
+    self.newbuffersz = None
+    self.newSr = None
+    self.running = False
+    self.thread = None
+    self.frames = 0
+    self.xruns = 0
+    self.pending = np.zeros(self.latency, dtype=np.complex64)
+
+  @property
+  def contents(self):
+    return self
+
+  def SetBufferSize(self,n):
+    """Change the Buffer Size in Frames at the Start of the Next Period, like jack_set_buffer_size"""
+    self.newbuffersz = int(n)
+
+  def SetSampleRate(self,Sr):
+    """Change the Sample Rate at the Start of the Next Period, as after a Server Restart"""
+    self.newSr = Sr
+
+  def SetDUT(self,z):
+    """Set the DUT Impedance, a Complex Number, None for Open or a Function of Frequency in Hz"""
+    self.dutz = z
+
+  def Gamma(self,f):
+    """Reflection Coefficient of the DUT at Frequency f in Hz"""
+    z = self.dutz(f) if callable(self.dutz) else self.dutz
+    if z is None: return 1.0+0j
+    return (z - self.feedlinez) / (z + self.feedlinez)
+
+  ## jacklib interface
+  def client_open(self,client_name,options,status,uuid=""):
+    self.name = client_name
+    return self
+
+  def client_close(self,client):
+    self.deactivate(client)
+
+  def port_register(self,client,port_name,port_type,flags,buffer_size):
+    port = SimPort(self.name+":"+port_name,flags,self.buffersz)
+    self.ports[port_name] = port
+    return port
+
+  def port_get_buffer(self,port,nframes):
+    return port.buffer.ctypes.data
+
+  def port_get_latency_range(self,port,mode,range_):
+    ## Half the round trip on each side
+    range_.min = range_.max = self.latency // 2
+
+  def set_process_callback(self,client,process_callback,arg):
+    self.process_callback = process_callback
+    self.process_arg = arg
+    return 0
+
+  def set_process_thread(self,client,thread_callback,arg):
+    self.thread_callback = thread_callback
+    self.thread_arg = arg
+    return 0
+
+  def cycle_wait(self,client):
+    """Wait for the Next Period and Return its Length, 0 once Deactivated"""
+    while self.running:
+      self.Reconfigure()
+      self.Pace()
+      n = self.buffersz
+      self.Receive(n)
+      if not self.Xrun():
+        return n
+      self.Send(n)
+      self.frames += n
+    return 0
+
+  def cycle_signal(self,client,status):
+    """Finish the Period Returned by cycle_wait"""
+    self.Send(self.buffersz)
+    self.frames += self.buffersz
+
+  def set_buffer_size_callback(self,client,bufsize_callback,arg):
+    self.buffer_size_callback = bufsize_callback
+    self.buffer_size_arg = arg
+    return 0
+
+  def set_sample_rate_callback(self,client,srate_callback,arg):
+    self.sample_rate_callback = srate_callback
+    self.sample_rate_arg = arg
+    return 0
+
+  def set_xrun_callback(self,client,xrun_callback,arg):
+    self.xrun_callback = xrun_callback
+    self.xrun_arg = arg
+    return 0
+
+  def connect(self,client,source_port,destination_port):
+    ## All outputs are looped back to the inputs regardless of connections
+    return 0
+
+  def get_sample_rate(self,client):
+    return self.Sr
+
+  def get_buffer_size(self,client):
+    return self.buffersz
+
+  def activate(self,client):
+    if self.running: return 0
+    self.running = True
+    self.nexttime = time.time()
+    self.thread = threading.Thread(target=self.RunThread if self.thread_callback else self.Run)
+    self.thread.daemon = True
+    self.thread.start()
+    return 0
+
+  def deactivate(self,client):
+    self.running = False
+    if self.thread is not None and self.thread is not threading.current_thread():
+      self.thread.join()
+    self.thread = None
+    return 0
+
+  ## Simulation
+  def Run(self):
+    """Run Periods Paced at speed Times Real Time"""
+    while self.running:
+      self.Reconfigure()
+      self.Pace()
+      self.Cycle()
+
+  def RunThread(self):
+    """Run the Client Process Thread, which Paces Itself through cycle_wait"""
+    self.thread_callback(self.thread_arg)
+
+  def Reconfigure(self):
+    """Apply a Pending Buffer Size or Sample Rate Change between Periods and Notify the Client"""
+    if self.newbuffersz is not None:
+      ## Capture, process and playback each hold one period so the round trip changes by three
+      latency = max(self.latency + 3*(self.newbuffersz - self.buffersz),self.newbuffersz)
+      self.buffersz, self.newbuffersz = self.newbuffersz, None
+      for port in self.ports.values():
+        port.buffer = np.zeros(self.buffersz, dtype=np.float32)
+      if latency > self.latency:
+        self.pending = np.concatenate([np.zeros(latency-self.latency, dtype=np.complex64),self.pending])
+      else:
+        self.pending = self.pending[self.latency-latency:]
+      self.latency = latency
+      if self.buffer_size_callback: self.buffer_size_callback(self.buffersz,self.buffer_size_arg)
+    if self.newSr is not None:
+      self.Sr, self.newSr = self.newSr, None
+      if self.sample_rate_callback: self.sample_rate_callback(self.Sr,self.sample_rate_arg)
+
+  def Pace(self):
+    """Wait until the Next Period is Due"""
+    delay = self.nexttime - time.time()
+    if delay > 0:
+      time.sleep(delay)
+    else:
+      self.nexttime = time.time()
+    self.nexttime += self.buffersz / float(self.Sr) / self.speed
+
+  def Xrun(self):
+    """Randomly Lose a Period, Return True if the Client Does Not Run"""
+    if self.xrunprob and np.random.random() < self.xrunprob:
+      self.xruns += 1
+      self.ports['oI'].buffer[:] = 0
+      self.ports['oQ'].buffer[:] = 0
+      if self.xrun_callback: self.xrun_callback(self.xrun_arg)
+      return True
+    return False
+
+  def Cycle(self):
+    """Run One Jack Period"""
+    n = self.buffersz
+    self.Receive(n)
+    if not self.Xrun() and self.process_callback:
+      self.process_callback(n,self.process_arg)
+    self.Send(n)
+    self.frames += n
+
+  def Receive(self,n):
+    """Fill the Input Ports with the Delayed Response of the DUT"""
+    t = time.time()
+    s = self.pending[:n]
+    g = self.gain * (self.leakage + self.Gamma(self.softrock.lo + self.tonefreq)) * np.exp(1j*self.softrock.Phase(t))
+    r = g * s
+    if self.noise:
+      r = r + self.noise * (np.random.randn(n) + 1j*np.random.randn(n))
+    ## VNA forms the complex signal as I - jQ
+    self.ports['iI'].buffer[:] = r.real
+    self.ports['iQ'].buffer[:] = -r.imag
+    self.pending = self.pending[n:]
+
+  def Send(self,n):
+    """Queue the Output Ports for Return after the Round Trip Latency"""
+    s = self.ports['oI'].buffer[:n] + 1j*self.ports['oQ'].buffer[:n]
+    self.pending = np.concatenate([self.pending,s.astype(np.complex64)])
@@ -0,0 +1,107 @@
+# PySDRVNA Toolkit is a Python toolkit to use your Software Defined Radio
+# as a simple Vector Network Analyzer.
+# Copyright (c) 2013 by Steve Haynal, KF7O.
+
+# PySDRVNA Toolkit is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3.
+
+# PySDRVNA Toolkit is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License at <http://www.gnu.org/licenses/> for details.
+
+from __future__ import print_function
+import numpy as np
+import pickle
+
+from Si570 import *
+
+
+def LoadSweepPlan(fn):
+    '''Load a Saved Sweep Plan Object'''
+    pf = open(fn+".vsp", 'rb')
+    p = pickle.load(pf)
+    pf.close()
+    return p
+
+
+class SweepPlan:
+
+  def __init__(self,vna,freq,schedule=False):
+    """Compile a Sweep Plan for an Array of Frequencies in MHz
+
+    With schedule the captures are reordered to minimise Si570 DCO jumps,
+    readings are still stored at the original frequency indices."""
+    self.freq = np.array(freq,dtype=float)
+
+    ## VNA settings the plan depends on
+    self.iffreq = vna.freq
+    self.tones = vna.tones
+    self.tonespacing = vna.tonespacing
+    self.tonebins = np.copy(vna.tonebins)
+    self.smoothtune = vna.smoothtune
+
+    ## Captures as the RF frequency in Hz of the first tone and the frequency indices of each tone
+    self.schedule = schedule
+    if schedule:
+      ## Ascending frequency keeps points within one smooth tune range together
+      ## and makes each DCO jump a hop to the next group
+      order = np.argsort(self.freq,kind='mergesort')
+      self.steps = [(f,[int(order[i]) for i in indices]) for f, indices in vna.SweepSteps(self.freq[order])]
+    else:
+      self.steps = list(vna.SweepSteps(self.freq))
+
+    ## LO and IF split of each capture
+    self.lo = np.array([f - self.iffreq for f, indices in self.steps])
+
+    ## Packed USB payloads for the set frequency and write registers commands
+    self.words = [FreqToWord(lo) for lo in self.lo]
+    self.registers = [Registers(lo) for lo in self.lo]
+    self.registers = [PackRegisters(r) if r else None for r in self.registers]
+
+    ## Expected FFT bin of every frequency
+    self.bins = np.zeros(self.freq.size,dtype=int)
+    for f, indices in self.steps:
+      for j, i in enumerate(indices):
+        self.bins[i] = self.tonebins[j]
+
+    self.retune = self.ClassifyRetunes(vna.smoothcenter)
+
+  def __repr__(self):
+    return "SweepPlan(%d frequencies, %d captures, %d DCO jumps)" % (self.freq.size,len(self.steps),len(self.Jumps()))
+
+  def ClassifyRetunes(self,center=None):
+    """Classify the Retune to Each Capture Starting from a Smooth Tune Center"""
+    classes = []
+    for lo in self.lo:
+      rc, center = RetuneClass(lo,center,self.smoothtune)
+      classes.append(rc)
+    return classes
+
+  def Jumps(self):
+    """Return the Indices of Captures that Need a New Si570 DCO Frequency"""
+    return [k for k, rc in enumerate(self.retune) if rc == 'jump']
+
+  def Groups(self):
+    """Return Capture Index Ranges that Share One Si570 DCO Frequency"""
+    jumps = self.Jumps() + [len(self.steps)]
+    return [(jumps[k],jumps[k+1]) for k in range(len(jumps)-1)]
+
+  def Matches(self,vna,freq):
+    """Check the Plan Applies to these Frequencies and the VNA Settings"""
+    return (np.array_equal(self.freq,np.asarray(freq,dtype=float)) and
+            self.iffreq == vna.freq and
+            self.tones == vna.tones and
+            self.tonespacing == vna.tonespacing)
+
+  def Steps(self):
+    """Yield the RF Frequency, Frequency Indices and USB Payload of Each Capture"""
+    for (f, indices), word in zip(self.steps,self.words):
+      yield f, indices, word
+
+  def SavePlan(self,fn):
+    """Save Sweep Plan Object"""
+    pkl_file = open(fn+".vsp", 'wb')
+    pickle.dump( self, pkl_file )
+    pkl_file.close()
@@ -12,47 +12,47 @@
 # GNU General Public License at <http://www.gnu.org/licenses/> for details.
 
 from __future__ import print_function
-import struct, usb.core, usb.util, traceback, pyfftw, time, math
+import struct, traceback, pyfftw, time, math
 import numpy as np
 import scipy as sp
-import jacklib, ctypes, threading, getopt, sys, os
-import pickle
+import ctypes, threading, getopt, sys, os
+## Jack and pyusb are only needed for the hardware backend
+try:
+  import jacklib
+except ImportError:
+  jacklib = None
+try:
+  import usb.core, usb.util
+except ImportError:
+  usb = None
+import pickle, json
+try:
+  import queue
+except ImportError:
+  import Queue as queue
 import matplotlib as mpl
 ## Use Qt4Agg, TkAgg or WXAgg as others cause xruns
 mpl.use('Qt4Agg',warn=False)
 import matplotlib.pyplot as plt
 
 from Measurement import *
+from Si570 import *
+from SweepPlan import *
+from Recorder import *
+from Progress import *
+import DSP
 import config
 
-#####
-## All si570 interface code is borrow directly from or based on QUISK. Thank you!
-#####
+if usb:
+  IN =  usb.util.build_request_type(usb.util.CTRL_IN,  usb.util.CTRL_TYPE_VENDOR, usb.util.CTRL_RECIPIENT_DEVICE)
+  OUT = usb.util.build_request_type(usb.util.CTRL_OUT, usb.util.CTRL_TYPE_VENDOR, usb.util.CTRL_RECIPIENT_DEVICE)
+else:
+  IN = 0xC0
+  OUT = 0x40
 
-# All USB access is through control transfers using pyusb.
-#   byte_array      = dev.ctrl_transfer (IN,  bmRequest, wValue, wIndex, length, timout)
-#   len(string_msg) = dev.ctrl_transfer (OUT, bmRequest, wValue, wIndex, string_msg, timout)
-# I2C-address of the SI570;  Thanks to Joachim Schneider, DB6QS
-si570_i2c_address = 0x55
-
-# Thanks to Ethan Blanton, KB8OJH, for this patch for the Si570 (many SoftRocks):
-# These are used by SetFreqByDirect(); see below.
-# The Si570 DCO must be clamped between these values
-SI570_MIN_DCO = 4.85e9
-SI570_MAX_DCO = 5.67e9
-# The Si570 has 6 valid HSDIV values.  Subtract 4 from HSDIV before
-# stuffing it.  We want to find the highest HSDIV first, so start
-# from 11.
-SI570_HSDIV_VALUES = [11, 9, 7, 6, 5, 4]
-
-si570_xtal_freq = 114251870
-
-
-IN =  usb.util.build_request_type(usb.util.CTRL_IN,  usb.util.CTRL_TYPE_VENDOR, usb.util.CTRL_RECIPIENT_DEVICE)
-OUT = usb.util.build_request_type(usb.util.CTRL_OUT, usb.util.CTRL_TYPE_VENDOR, usb.util.CTRL_RECIPIENT_DEVICE)
-
-UBYTE2 = struct.Struct('<H')
-UBYTE4 = struct.Struct('<L')    # Thanks to Sivan Toledo
+## Stages timed for every capture when timing is enabled, in order
+TIMINGSTAGES = ['setfreq','settle','ptton','capture','pttoff','sync','fft','print']
+TIMINGCOLUMN = dict((s,k+1) for k, s in enumerate(TIMINGSTAGES))
 
 ## To supress annoying Jack error messages if script starts jackd
 def RedirectStderr():
@@ -71,21 +71,80 @@ class VNA:
     if configd is None: configd = config.__dict__
 
     self.printlevel = configd['printlevel']
+    ## Per point records are written by a background thread
+    sinks = [ConsoleSink()]
+    if configd['progresslog']: sinks.append(FileSink(configd['progresslog']))
+    self.progress = Progress(sinks,configd['progressqueue'],self.printlevel)
     self.fftn = configd['fftn']
+    self.averages = configd['averages']
     self.amp = configd['amp']
+    self.tones = configd['tones']
+    self.tonestep = configd['tonestep']
     self.warmuptime = configd['warmuptime']
     self.cooldowntime = configd['cooldowntime']
+    self.detector = configd['detector']
+    self.pipeline = configd['pipeline']
+    self.schedule = configd['schedule']
+
+    ## Retry policy and telemetry, xruncount counts every Jack xrun since startup
+    self.attempts = configd['attempts']
+    self.syncresize = configd['syncresize']
+    self.syncresizemax = configd['syncresizemax']
+    self.xruncount = 0
+    self.failed = []
+    self.ResetStats()
+
+    ## Ring of per capture stage timestamps, column 0 is the start of the capture
+    self.timing = configd['timing']
+    self.timings = np.full((max(self.timing,1),len(TIMINGSTAGES)+1), np.nan)
+    self.timingn = 0
+    self.timingrow = 0
+    
+    ## Retune settling
+    self.settletime = configd['settletime']
+    self.settledetect = configd['settledetect']
+    self.settlephase = configd['settlephase']
+    ## Si570 smooth tune range in ppm, read from the SoftRock when available
+    self.smoothtune = 3500
+    self.smoothcenter = None
+    self.retune = 'jump'
+    ## Running frequency last written to the Si570, so printing never reads it over USB
+    self.lofreq = None
+    self.verifyfreq = configd['verifyfreq']
+
+    ## Raw capture recording, tagged with the standard being measured
+    self.recorder = None
+    self.recordtag = 'dut'
    
     self.docapture = threading.Event()
     self.docapture.set()
+    ## Optional function the Jack thread calls when a capture completes
+    self.capturedone = None
 
     self.xrun = threading.Event()
     self.xrun.clear()
 
     self.startframe = 0
 
-    #self.jackclient = jacklib.client_open("pysdrvna", jacklib.JackNoStartServer | jacklib.JackSessionID, None)
-    self.jackclient = jacklib.client_open("pysdrvna", jacklib.JackSessionID, None)
+    ## Streaming ring buffer state, enabled once the arrays exist
+    self.streaming = False
+    self.ringarrays = configd['ringarrays']
+    self.ringframes = 0
+    self.armframe = -1
+    self.armpending = False
+
+    ## The backend provides the jacklib interface, either jacklib itself or a simulation
+    self.backend = configd['backend']
+    if self.backend == 'sim':
+      import SimBackend
+      self.jack = SimBackend.SimJack(configd)
+    elif self.backend == 'replay':
+      self.jack = ReplayJack(configd)
+    else:
+      self.jack = jacklib
+
+    #self.jackclient = self.jack.client_open("pysdrvna", self.jack.JackNoStartServer | self.jack.JackSessionID, None)
+    self.jackclient = self.jack.client_open("pysdrvna", self.jack.JackSessionID, None)
     
     try:
       self.jackclient.contents
@@ -94,29 +153,73 @@ class VNA:
       return
       #raise
 
-    self.iI = jacklib.port_register(self.jackclient,"iI", jacklib.JACK_DEFAULT_AUDIO_TYPE, jacklib.JackPortIsInput, 0)
-    self.iQ = jacklib.port_register(self.jackclient,"iQ", jacklib.JACK_DEFAULT_AUDIO_TYPE, jacklib.JackPortIsInput, 0)    
+    self.iI = self.jack.port_register(self.jackclient,"iI", self.jack.JACK_DEFAULT_AUDIO_TYPE, self.jack.JackPortIsInput, 0)
+    self.iQ = self.jack.port_register(self.jackclient,"iQ", self.jack.JACK_DEFAULT_AUDIO_TYPE, self.jack.JackPortIsInput, 0)    
 
-    self.oI = jacklib.port_register(self.jackclient,"oI", jacklib.JACK_DEFAULT_AUDIO_TYPE, jacklib.JackPortIsOutput, 0)
-    self.oQ = jacklib.port_register(self.jackclient,"oQ", jacklib.JACK_DEFAULT_AUDIO_TYPE, jacklib.JackPortIsOutput, 0)
+    self.oI = self.jack.port_register(self.jackclient,"oI", self.jack.JACK_DEFAULT_AUDIO_TYPE, self.jack.JackPortIsOutput, 0)
+    self.oQ = self.jack.port_register(self.jackclient,"oQ", self.jack.JACK_DEFAULT_AUDIO_TYPE, self.jack.JackPortIsOutput, 0)
    
-    jacklib.set_process_callback(self.jackclient, self.JackProcess, 0)
-    jacklib.set_xrun_callback(self.jackclient, self.JackXrun, 0)
-
-    jacklib.activate(self.jackclient)
+    ## Constants and functions used by the real time process callback
+    self.ssz = ctypes.sizeof(self.jack.jack_default_audio_sample_t)
+    ## Call the C library directly rather than through the jacklib wrapper when available
+    try:
+      self.portbuffer = self.jack.jacklib.jack_port_get_buffer
+    except AttributeError:
+      self.portbuffer = self.jack.port_get_buffer
+    self.memmove = ctypes.memmove
+    self.memset = ctypes.memset
+    self.clock = time.perf_counter
+    ## Ring of process callback durations, None to not time the callback
+    self.cbtimes = np.zeros(configd['callbackstats']) if configd['callbackstats'] else None
+    self.cbn = 0
+    ## Periods completed by the process callback, see WaitCycle
+    self.cycles = 0
+
+    ## Either Jack calls JackProcess every period or our own process thread waits for each period
+    self.processmode = configd['processmode']
+    self.threadrunning = False
+    if self.processmode == 'thread':
+      try:
+        self.cyclewait = self.jack.jacklib.jack_cycle_wait
+        self.cyclesignal = self.jack.jacklib.jack_cycle_signal
+      except AttributeError:
+        self.cyclewait = self.jack.cycle_wait
+        self.cyclesignal = self.jack.cycle_signal
+      self.threadrunning = True
+      self.jack.set_process_thread(self.jackclient, self.JackThread, None)
+    else:
+      self.jack.set_process_callback(self.jackclient, self.JackProcess, 0)
+    self.jack.set_xrun_callback(self.jackclient, self.JackXrun, 0)
+
+    ## Sample rate and buffer size changes are recorded by the Jack callbacks and
+    ## applied by Reconfigure before the next capture
+    self.reconfigure = False
+    self.pendingSr = None
+    self.pendingbuffersz = None
+    self.resumestreaming = False
+    self.configgen = 0
+    ## The RF frequency last tuned and the test tone the LO was set for, see Detuned
+    self.tunedfreq = None
+    self.tunedif = None
+    self.reconfiglock = threading.Lock()
+    self.jack.set_buffer_size_callback(self.jackclient, self.JackBufferSize, 0)
+    self.jack.set_sample_rate_callback(self.jackclient, self.JackSampleRate, 0)
+
+    self.jack.activate(self.jackclient)
    
-    jacklib.connect(self.jackclient,"pysdrvna:oQ", configd['outQ'])
-    jacklib.connect(self.jackclient,"pysdrvna:oI", configd['outI'])    
+    self.jack.connect(self.jackclient,"pysdrvna:oQ", configd['outQ'])
+    self.jack.connect(self.jackclient,"pysdrvna:oI", configd['outI'])    
     
-    jacklib.connect(self.jackclient,configd['inQ'],"pysdrvna:iQ")
-    jacklib.connect(self.jackclient,configd['inI'],"pysdrvna:iI") 
+    self.jack.connect(self.jackclient,configd['inQ'],"pysdrvna:iQ")
+    self.jack.connect(self.jackclient,configd['inI'],"pysdrvna:iI") 
     
-    self.Sr = float(jacklib.get_sample_rate(self.jackclient))
+    self.Sr = float(self.jack.get_sample_rate(self.jackclient))
     self.dt = 1.0/self.Sr
       
     ## Align frequency to nearest bin
     self.fftbin = int(round((configd['freq']/self.Sr)*self.fftn))      
     self.freq = (float(self.fftbin)/self.fftn) * self.Sr
+    self.InitTones()
     
     ## Windowing function
     #self.fftwindow = np.blackman(self.fftn)
@@ -127,78 +230,169 @@ class VNA:
     #self.fftwindow = None
       
     ## Latency settings
-    jlr = jacklib.jack_latency_range_t()
-    jacklib.port_get_latency_range(self.oI,jacklib.JackPlaybackLatency,jlr)
-    self.minrtframes = jlr.min
-    jacklib.port_get_latency_range(self.iI,jacklib.JackCaptureLatency,jlr)
-    self.minrtframes += jlr.min
- 
-    # The above code does not always work
-    # Reasonable estimate is 3 times the buffer size
-    ## Compute initial array length
-    self.buffersz = int(jacklib.get_buffer_size(self.jackclient))
-    if self.minrtframes < (3*self.buffersz):
-        self.minrtframes = 3 * self.buffersz
+    self.buffersz = int(self.jack.get_buffer_size(self.jackclient))
+    self.minrtframes = self.MinRTFrames()
 
 
     ## rtframes is the round trip audio latency, or when the received audio signal will start    
+    self.autortframes = not configd['rtframes']
     self.rtframes = configd['rtframes'] if configd['rtframes'] else self.minrtframes
+    ## Round trip latency measurement, cached per Jack ports, buffer size and sample rate
+    self.latencycache = configd['latencycache']
+    self.latencyprobe = configd['latencyprobe']
+    self.latencymax = configd['latencymax']
+    self.jackports = (self.backend,configd['inI'],configd['inQ'],configd['outI'],configd['outQ'])
     ## delta from rtframes to phase shift sync in frames
     self.rtframes2sync = configd['rtframes2sync']
     ## delta from phase shift sync to fft start in frames
     self.sync2fft = configd['sync2fft']
     ## delta from end of fft to end of audio
     self.fft2end = configd['fft2end']
+    ## Sync method and correlation threshold
+    self.syncmode = configd['syncmode']
+    self.syncconfidence = configd['syncconfidence']
+    self.syncconf = 0.0
+    self.syncfrac = 0.0
+    ## Sync tracking state and hit/miss counters
+    self.synctrack = configd['synctrack']
+    self.synctracktol = configd['synctracktol']
+    self.synclast = None
+    self.synchits = 0
+    self.syncmisses = 0
 
 
-    if configd['rtframes'] is None:
+    self.synci = self.rtframes
+    self.InitJackArrays(self.freq,self.ArrayLength())
+    
+    self.fftdtype = configd['fftdtype']
+    self.InitFFT()
+    
+    ## Single bin detector kernel, built on first use
+    self.dftkey = None
+    self.settlekey = None
+    self.reading = 0j
+    self.readings = np.zeros(self.tones, dtype=np.complex128)
+    self.readingvar = np.zeros(self.tones)
+
+    if configd['streaming']: self.StartStreaming()
+
+    self.OpenSoftRock()
+    if configd['latencycalibrate'] and self.backend != 'replay':
+      try:
+        self.CalibrateLatency()
+      except IndexError as e:
+        print("Latency calibration failed:",e)
+    self.Info()
+
+  def MinRTFrames(self):
+    """Return the Minimum Round Trip Latency in Frames Reported by Jack"""
+    jlr = self.jack.jack_latency_range_t()
+    self.jack.port_get_latency_range(self.oI,self.jack.JackPlaybackLatency,jlr)
+    minrtframes = jlr.min
+    self.jack.port_get_latency_range(self.iI,self.jack.JackCaptureLatency,jlr)
+    minrtframes += jlr.min
+ 
+    # The above code does not always work
+    # Reasonable estimate is 3 times the buffer size
+    if minrtframes < (3*self.buffersz):
+        minrtframes = 3 * self.buffersz
+    return minrtframes
+
+  def ArrayLength(self):
+    """Return the Jack Array Length in Whole Buffers for the Current rtframes"""
+    if self.autortframes:
         ## Loose fit if estimating based on minrtframes
-        buffers, remainder = divmod((2*self.rtframes) + self.rtframes2sync + self.sync2fft + self.fftn + self.fft2end,self.buffersz)
+        buffers, remainder = divmod((2*self.rtframes) + self.rtframes2sync + self.sync2fft + (self.averages*self.fftn) + self.fft2end,self.buffersz)
     else:
         ## Tight fit if rtframes is defined
-        buffers, remainder = divmod(self.rtframes + self.rtframes2sync + self.sync2fft + self.fftn + self.fft2end,self.buffersz)
+        buffers, remainder = divmod(self.rtframes + self.rtframes2sync + self.sync2fft + (self.averages*self.fftn) + self.fft2end,self.buffersz)
   
     if remainder > 0: buffers = buffers + 1
-    self.synci = self.rtframes
-    self.InitJackArrays(self.freq,buffers*self.buffersz)
-    
-    self.fftia = pyfftw.n_byte_align_empty(self.fftn, 16, 'complex128')
-    self.fftoa = pyfftw.n_byte_align_empty(self.fftn, 16, 'complex128')
-    ## Create FFT Plan
-    self.fft = pyfftw.FFTW(self.fftia,self.fftoa)
+    return buffers*self.buffersz
 
-    self.OpenSoftRock()
-    self.Info()
+  def InitTones(self):
+    """Compute Test Tone Bins and Spacing"""
+    self.tonebins, self.tonespacing, self.tonephases = DSP.ToneLayout(self.fftbin,self.fftn,self.Sr,self.tones,self.tonestep)
 
   def InitJackArrays(self,freq,samples):
     """Initialize Jack Arrays"""
-    self.iIa = sp.zeros(samples).astype(sp.float32)
-    self.iQa = sp.zeros(samples).astype(sp.float32)      
-    
-    self.oIa = sp.zeros(samples, dtype=sp.float32 )
-    self.oQa = sp.zeros(samples, dtype=sp.float32 )
-    
-    ## 100 frames warmup
-    sf = 0
-    ef = self.rtframes2sync
-    samples = sp.pi + (2*sp.pi*freq*(self.dt * sp.r_[sf:ef]))
-    self.oIa[sf:ef] = self.amp * sp.cos(samples)
-    self.oQa[sf:ef] = self.amp * sp.sin(samples)
-    
-    # For IQ balancing
-    #self.oIa[sf:ef] = sp.cos(samples) - (sp.sin(samples)*(1+self.oalpha)*sp.sin(self.ophi))
-    #self.oQa[sf:ef] = sp.sin(samples)*(1+self.oalpha)*sp.cos(self.ophi)
-    
-    ## 180 phase change 
-    sf = ef
-    ef = ef + self.sync2fft + self.fftn + self.fft2end
-    samples = (2*sp.pi*freq*(self.dt * sp.r_[sf:ef]))
-    self.oIa[sf:ef] = self.amp * sp.cos(samples) 
-    self.oQa[sf:ef] = self.amp * sp.sin(samples)   
-    
-    # For IQ balancing
-    #self.oIa[sf:ef] = sp.cos(samples) - (sp.sin(samples)*(1+self.oalpha)*sp.sin(self.ophi))
-    #self.oQa[sf:ef] = sp.sin(samples)*(1+self.oalpha)*sp.cos(self.ophi)    
+    ## The process callback holds raw pointers into the stimulus, capture arrays and ring
+    self.CancelCapture()
+    streaming = self.PauseStreaming()
+    length = self.sync2fft + (self.averages*self.fftn) + self.fft2end
+    self.SetStimulusArrays(*DSP.Stimulus(freq,samples,self.dt,self.amp,self.tonespacing,self.tonephases,self.rtframes2sync,length))
+    self.SetCaptureArrays(np.zeros(samples, dtype=np.float32),np.zeros(samples, dtype=np.float32))
+
+    ## Template for correlation sync, the stimulus around the phase reversal
+    self.synctemplate = (self.oIa + 1j * self.oQa)[:self.rtframes2sync+self.sync2fft].astype(np.complex64)
+    self.synctemplatefft = {}
+
+    if streaming: self.StartStreaming()
+
+  def InitRingBuffer(self,samples):
+    """Initialize Streaming Ring Buffer"""
+    ## Ring length is a whole number of Jack periods so a period never wraps
+    buffers, remainder = divmod(self.ringarrays*samples,self.buffersz)
+    if remainder > 0: buffers = buffers + 1
+    ringn = buffers*self.buffersz
+    try:
+      if self.ringI.size == ringn: return
+    except AttributeError:
+      pass
+    self.ringI = np.zeros(ringn, dtype=np.float32)
+    self.ringQ = np.zeros(ringn, dtype=np.float32)
+    self.ringIp = self.ringI.ctypes.data
+    self.ringQp = self.ringQ.ctypes.data
+
+  def SetStimulusArrays(self,oIa,oQa):
+    """Play these Arrays, Precomputing the Pointers the Process Callback Needs"""
+    self.oIa = oIa
+    self.oQa = oQa
+    self.oIp = oIa.ctypes.data
+    self.oQp = oQa.ctypes.data
+
+  def SetCaptureArrays(self,iIa,iQa):
+    """Capture into these Arrays, Precomputing what the Process Callback Needs"""
+    self.iIa = iIa
+    self.iQa = iQa
+    self.iIp = iIa.ctypes.data
+    self.iQp = iQa.ctypes.data
+    self.capturesamples = iIa.size
+    self.capturebytes = iIa.size * self.ssz
+    
+  def StartStreaming(self):
+    """Switch to Continuous Ring Buffer Capture"""
+    self.PauseStreaming()
+    self.InitRingBuffer(self.iIa.size)
+    self.armframe = -1
+    self.armpending = False
+    self.streaming = True
+
+  def StopStreaming(self):
+    """Switch to Per-Measurement Jack Capture"""
+    self.PauseStreaming()
+    self.docapture.set()
+
+  def PauseStreaming(self):
+    """Stop Streaming and Wait until the Process Callback is Done with the Ring, Return True if it was Streaming"""
+    if not self.streaming: return False
+    self.streaming = False
+    self.WaitCycle()
+    return True
+
+  def CancelCapture(self):
+    """Abandon a Capture in Flight and Wait until the Process Callback is Done with the Capture Arrays"""
+    if self.docapture.is_set(): return
+    self.docapture.set()
+    ## Streaming captures are copied out of the ring by FinishCapture, not the callback
+    if not self.streaming: self.WaitCycle()
+
+  def WaitCycle(self):
+    """Wait until the Process Callback Completes a Period, or Jack Appears Stopped"""
+    cycles = self.cycles
+    deadline = time.time() + max(0.1, 20.0*self.buffersz/self.Sr)
+    while self.cycles == cycles and time.time() < deadline:
+      time.sleep(0.001)
     
   def ResizeArrays(self,rtframes=None):
     """Resize Jack Arrays"""
@@ -209,20 +403,21 @@ class VNA:
         raise IndexError("Sync index appears uninitialized")
       else:
         rtframes = self.synci - self.rtframes2sync
-        print("RTFrames computed from last Sync index",rtframes)
+        self.progress.Message("RTFrames computed from last Sync index",rtframes)
     
     ## Tight fit
-    buffers, remainder = divmod(rtframes + self.rtframes2sync + self.sync2fft + self.fftn + self.fft2end,self.buffersz)
+    buffers, remainder = divmod(rtframes + self.rtframes2sync + self.sync2fft + (self.averages*self.fftn) + self.fft2end,self.buffersz)
     if remainder > 0: buffers = buffers + 1
     
     
-    print("Array length was",self.iIa.size,end=" ")
+    length = self.iIa.size
     if buffers*self.buffersz != self.iIa.size:
       self.InitJackArrays(self.freq,buffers*self.buffersz)
-    print("now",self.iIa.size)
+    self.progress.Message("Array length was",length,"now",self.iIa.size)
     
-    print("RTFrames was",self.rtframes,"now",rtframes)
+    self.progress.Message("RTFrames was",self.rtframes,"now",rtframes)
     self.rtframes = rtframes
+    self.autortframes = False
     
   def CalibrateArrays(self):
     """Calibrate Array Lengths Assuming Good Audio Levels"""
@@ -236,6 +431,93 @@ class VNA:
         self.ResizeArrays(2*self.rtframes)
         i -= 1
 
+  def MeasureLatency(self):
+    """Measure the Round Trip Latency in Frames by Correlating a Chirp Probe, Return the Latency"""
+    if self.reconfigure: self.Reconfigure()
+    probe = DSP.Chirp(self.latencyprobe,self.Sr,self.amp)
+    buffers, remainder = divmod(self.latencymax + probe.size,self.buffersz)
+    if remainder > 0: buffers = buffers + 1
+    oIa = np.zeros(buffers*self.buffersz, dtype=np.float32)
+    oQa = np.zeros(buffers*self.buffersz, dtype=np.float32)
+    oIa[:probe.size] = probe.real
+    oQa[:probe.size] = probe.imag
+
+    saved = (self.oIa,self.oQa,self.iIa,self.iQa)
+    gen = self.configgen
+    streaming = self.streaming
+    if streaming: self.StopStreaming()
+    self.SetStimulusArrays(oIa,oQa)
+    self.SetCaptureArrays(np.zeros_like(oIa),np.zeros_like(oQa))
+    try:
+      attempts = self.attempts
+      while not self.CaptureOnce():
+        attempts = attempts - 1
+        if attempts <= 0: raise IndexError("Xruns while measuring latency")
+      if gen != self.configgen: raise IndexError("Jack reconfigured while measuring latency")
+      lag, conf = DSP.ProbeLatency(self.iIa,self.iQa,probe,self.syncconfidence)
+    finally:
+      ## Reconfigure already rebuilt the arrays for a new Jack configuration
+      if gen == self.configgen:
+        self.SetStimulusArrays(*saved[:2])
+        self.SetCaptureArrays(*saved[2:])
+      if streaming: self.StartStreaming()
+
+    print("Measured latency",lag,"frames, confidence %.2f" % conf)
+    return lag
+
+  def LatencyKey(self):
+    return self.jackports + (self.buffersz,int(self.Sr))
+
+  def CachedLatency(self):
+    """Return the Cached Round Trip Latency for the Current Jack Configuration or None"""
+    if not self.latencycache: return None
+    try:
+      pf = open(self.latencycache,'rb')
+      cache = pickle.load(pf)
+      pf.close()
+    except Exception:
+      return None
+    rtframes = cache.get(self.LatencyKey())
+    ## Sync never searches before minrtframes, so a shorter latency is stale
+    if rtframes is not None and rtframes < self.minrtframes: return None
+    return rtframes
+
+  def CacheLatency(self,rtframes):
+    """Save the Round Trip Latency for the Current Jack Configuration"""
+    if not self.latencycache: return
+    try:
+      pf = open(self.latencycache,'rb')
+      cache = pickle.load(pf)
+      pf.close()
+    except Exception:
+      cache = {}
+    cache[self.LatencyKey()] = rtframes
+    pkl_file = open(self.latencycache,'wb')
+    pickle.dump( cache, pkl_file )
+    pkl_file.close()
+
+  def CalibrateLatency(self,measure=False):
+    """Set rtframes and Tight Jack Arrays from the Round Trip Latency
+
+    The latency is measured once with a chirp probe and cached in latencycache for the
+    Jack ports, buffer size and sample rate. Set measure True to measure it again."""
+    rtframes = None if measure else self.CachedLatency()
+    if rtframes is None:
+      rtframes = self.MeasureLatency()
+      self.CacheLatency(rtframes)
+    else:
+      print("Cached latency",rtframes,"frames")
+    self.ResizeArrays(rtframes)
+
+  def NewAverages(self,averages):
+    """Change the Number of Averaged FFT Windows and Resize the Jack Arrays"""
+    print("Averages was",self.averages,"now",averages)
+    if self.averages != averages:
+      self.averages = averages
+      ## Keeps the loose fit when rtframes is still an estimate, the stimulus must
+      ## cover the new number of windows even if the length did not change
+      self.InitJackArrays(self.freq,self.ArrayLength())
+
   def NewAmp(self,amp):
     """Regenerate Test Tone with New Amplitude"""
     print("Amplitude was",self.amp,"now",amp)
@@ -246,7 +528,8 @@ class VNA:
   def Info(self):
     """Print Information"""
     print("FFT Size:",self.fftn,"FFT Bin:",self.fftbin,"Test Freq:",self.freq,"Amp:",self.amp,"RT Frames:",self.rtframes,end=" ")
-    print("RT2Sync:",self.rtframes2sync,"Sync2FFT:",self.sync2fft,"FFT2End:",self.fft2end,"Array Length:",self.iIa.size,"Sync Index:",self.synci)
+    print("RT2Sync:",self.rtframes2sync,"Sync2FFT:",self.sync2fft,"FFT2End:",self.fft2end,"Array Length:",self.iIa.size,"Sync Index:",self.synci,end=" ")
+    print("Ring Length:",self.ringI.size if self.streaming else None)
     
     
   ## SoftRock Control
@@ -256,7 +539,10 @@ class VNA:
     # find our device
     self.usb_vendor_id = 0x16c0
     self.usb_product_id = 0x05dc
-    self.usb_dev = usb.core.find(idVendor=0x16c0, idProduct=0x05dc)
+    if self.backend != 'jack':
+      self.usb_dev = self.jack.softrock
+    else:
+      self.usb_dev = usb.core.find(idVendor=0x16c0, idProduct=0x05dc)
     if self.usb_dev is None:
       print('USB device not found VendorID 0x%X ProductID 0x%X' % (self.usb_vendor_id, self.usb_product_id))
     else:
@@ -269,11 +555,15 @@ class VNA:
           ver = 'unknown'
         print('Capture from SoftRock Firmware %s' % ver)
         print('Startup freq', self.GetStartupFreq())
-        print('Run freq', self.GetFreq())
+        self.lofreq = self.GetFreq()
+        print('Run freq', self.lofreq)
+        ## The SoftRock smooth tunes around the frequency it is running at
+        self.smoothcenter = self.lofreq
         print('Address 0x%X' % self.usb_dev.ctrl_transfer(IN, 0x41, 0, 0, 1)[0])
         sm = self.usb_dev.ctrl_transfer(IN, 0x3B, 0, 0, 2)
         sm = UBYTE2.unpack(sm)[0]
         print('Smooth tune', sm)
+        if sm: self.smoothtune = sm
       except:
         print("No permission to access the SoftRock USB interface")
         self.usb_dev = None
@@ -282,77 +572,53 @@ class VNA:
     """Return the SoftRock Startup Frequency"""
     if not self.usb_dev: return 0
     ret = self.usb_dev.ctrl_transfer(IN, 0x3C, 0, 0, 4)
-    s = ret.tostring()
-    freq = UBYTE4.unpack(s)[0]
-    freq = int(freq * 1.0e6 / 2097152.0 / 4.0 + 0.5)
-    return freq
+    return WordToFreq(bytearray(ret))
     
   def GetFreq(self):    # return the running frequency / 4
     """Return the SoftRock Running Frequency"""
     if not self.usb_dev: return 0
     ret = self.usb_dev.ctrl_transfer(IN, 0x3A, 0, 0, 4)
-    s = ret.tostring()
-    freq = UBYTE4.unpack(s)[0]
-    freq = int(freq * 1.0e6 / 2097152.0 / 4.0 + 0.5)
-    return freq    
-    
-  def SetFreq(self, freq):
-    """Set the SoftRock Running Frequency"""
-    freq = int(freq/1.0e6 * 2097152.0 * 4.0 + 0.5)
-    s = UBYTE4.pack(freq)
+    return WordToFreq(bytearray(ret))    
+    
+  def SetFreq(self, freq, s=None):
+    """Set the SoftRock Running Frequency, Optionally with a Precomputed Payload"""
+    self.retune, self.smoothcenter = RetuneClass(freq,self.smoothcenter,self.smoothtune)
+    if s is None: s = FreqToWord(freq)
     try:
       self.usb_dev.ctrl_transfer(OUT, 0x32, si570_i2c_address + 0x700, 0, s)
+      self.lofreq = WordToFreq(s)
     except usb.core.USBError:
+      self.lofreq = None
       traceback.print_exc()
     
   def SetFreqNew(self, freq): # Thanks to Ethan Blanton, KB8OJH
-    if freq == 0.0:
-      return False
-    # For now, find the minimum DCO speed that will give us the
-    # desired frequency; if we're slewing in the future, we want this
-    # to additionally yield an RFREQ ~= 512.
-    freq = int(freq * 4)
-    dco_new = None
-    hsdiv_new = 0
-    n1_new = 0
-    for hsdiv in SI570_HSDIV_VALUES:
-      n1 = int(math.ceil(SI570_MIN_DCO / (freq * hsdiv)))
-      if n1 < 1:
-        n1 = 1
-      else:
-        n1 = ((n1 + 1) / 2) * 2
-      dco = (freq * 1.0) * hsdiv * n1
-      # Since we're starting with max hsdiv, this can only happen if
-      # freq was larger than we can handle
-      if n1 > 128:
-        continue
-      if dco < SI570_MIN_DCO or dco > SI570_MAX_DCO:
-        # This really shouldn't happen
-        continue
-      if not dco_new or dco < dco_new:
-        dco_new = dco
-        hsdiv_new = hsdiv
-        n1_new = n1
-    if not dco_new:
-      # For some reason, we were unable to calculate a frequency.
-      # Probably because the frequency requested is outside the range
-      # of our device.
+    """Set the SoftRock Running Frequency by Writing the Si570 Registers"""
+    registers = Registers(freq)
+    if registers is None:
       return False    # Failure
-    rfreq = dco_new / si570_xtal_freq
-    rfreq_int = int(rfreq)
-    rfreq_frac = int(round((rfreq - rfreq_int) * 2**28))
-    # It looks like the DG8SAQ protocol just passes r7-r12 straight
-    # To the Si570 when given command 0x30.  Easy enough.
-    # n1 is stuffed as n1 - 1, hsdiv is stuffed as hsdiv - 4.
-    hsdiv_new = hsdiv_new - 4
-    n1_new = int(n1_new - 1)
-    print(hsdiv_new,n1_new,rfreq_int,rfreq_frac)
-    s = struct.Struct('>BBL').pack((hsdiv_new << 5) + (n1_new >> 2),
-                                   ((n1_new & 0x3) << 6) + (rfreq_int >> 4),
-                                   ((rfreq_int & 0xf) << 28) + rfreq_frac)
+    ## A full register write always changes the DCO
+    self.retune = 'jump'
+    self.smoothcenter = freq
+    print(*registers)
+    s = PackRegisters(registers)
     self.usb_dev.ctrl_transfer(OUT, 0x30, si570_i2c_address + 0x700, 0, s)
+    self.lofreq = RegistersToFreq(s)
     return True   # Success
 
+  def LOFreq(self):
+    """Return the Cached SoftRock Running Frequency, Verified over USB if verifyfreq is Set"""
+    if self.verifyfreq or self.lofreq is None: self.VerifyFreq()
+    return self.lofreq
+
+  def VerifyFreq(self):
+    """Read the Running Frequency from the SoftRock, Return False if it Differs from the Cached Value"""
+    freq = self.GetFreq()
+    ok = self.lofreq is None or abs(freq - self.lofreq) <= 1
+    if not ok:
+      self.progress.Message("SoftRock running frequency",freq,"differs from last set frequency",self.lofreq)
+    self.lofreq = freq
+    return ok
+
 
   def PTT(self, ptt):
     if self.usb_dev:
@@ -362,56 +628,156 @@ class VNA:
         traceback.print_exc()
     
 
-  def Exit(self):
-    """Exit Cleanly from Interactive VNA"""
+  def Close(self):
+    """Stop Recording and Close the Jack Client"""
+    self.StopRecording()
+    self.threadrunning = False
     try:
-      jacklib.deactivate(self.jackclient)
+      self.jack.deactivate(self.jackclient)
     except:
       pass
     try:
-      jacklib.client_close(self.jackclient)
+      self.jack.client_close(self.jackclient)
     except:
       pass
+
+  def Exit(self):
+    """Exit Cleanly from Interactive VNA"""
+    self.Close()
     exit()
     
 
-  def Sync(self):
+  def Sync(self,iIa=None,iQa=None):
     """Locate the Sync Phase Shift"""
-    ## Find start by amplitude
-    mv = 0.7 * self.iIa[self.minrtframes:].max()
-    sia = np.nonzero( self.iIa[self.minrtframes:] > mv )[0]
-    si = sia[0] + self.minrtframes
-    
-    ## Phase change
-    synca = self.iIa[si:si+(2*self.rtframes2sync)] - 1j * self.iQa[si:si+(2*self.rtframes2sync)]    
-    anglea = np.angle(synca,deg=True) + 180
-    deltaaa = (anglea[1:] - anglea[:-1]) % 360
-    
-    ## Find sync index
-    try:
-        syncindex = (np.nonzero( (deltaaa > 90) & (deltaaa < 270) )[0][0]) + si 
-    except:
-        raise IndexError("Jack arrays are not long enough and/or bad sync. Resize arrays.")
-        
-    self.synci = syncindex
+    if iIa is None: iIa, iQa = self.iIa, self.iQa
+
+    synci = None
+    if self.synctrack and self.synclast is not None:
+      synci = self.SyncTrack(iIa,iQa,self.synclast)
+      if synci is None:
+        self.syncmisses += 1
+      else:
+        self.synchits += 1
+
+    if synci is None:
+      self.synclast = None
+      if self.syncmode == 'xcorr':
+        synci = self.SyncXCorr(iIa,iQa)
+      else:
+        synci = self.SyncPhase(iIa,iQa)
+
+    self.synci = synci
+    self.synclast = synci
     
-    if self.iIa.size < (self.synci + self.sync2fft + self.fftn):
+    if iIa.size < (self.synci + self.sync2fft + (self.averages*self.fftn)):
       raise IndexError("Jack arrays are not long enough and/or bad sync. Resize arrays.")
+
+  def SyncPhase(self,iIa,iQa):
+    """Locate the Sync Phase Shift by Amplitude and Phase Step"""
+    syncindex, self.syncconf, self.syncfrac = DSP.SyncPhase(iIa,iQa,self.minrtframes,self.rtframes2sync)
+    return syncindex
+
+  def SyncTrack(self,iIa,iQa,last):
+    """Verify the Sync Phase Shift Near the Last Sync Index, Return None if Not Found"""
+    r = DSP.SyncTrack(iIa,iQa,last,self.synctracktol,self.syncmode,self.synctemplate,self.rtframes2sync,self.syncconfidence)
+    if r is None: return None
+    syncindex, self.syncconf, self.syncfrac = r
+    return syncindex
+
+  def SyncXCorr(self,iIa,iQa):
+    """Locate the Sync Phase Shift by Correlation with the Stimulus"""
+    syncindex, self.syncconf, self.syncfrac = DSP.SyncXCorr(iIa,iQa,self.synctemplate,self.minrtframes,
+                                                            self.rtframes2sync,self.syncconfidence,self.synctemplatefft)
+    return syncindex
     
     
-  def DoFFT(self):
-    """Calculate the FFT"""
-    I = self.iIa[self.synci+self.sync2fft:self.synci+self.sync2fft+self.fftn]
-    Q = self.iQa[self.synci+self.sync2fft:self.synci+self.sync2fft+self.fftn]
+  def FFTSlice(self,iIa=None,iQa=None,window=None):
+    """Return the I and Q Samples of One or, if window is None, All FFT Windows"""
+    if iIa is None: iIa, iQa = self.iIa, self.iQa
+    if window is None:
+      start = self.synci + self.sync2fft
+      end = start + (self.averages*self.fftn)
+    else:
+      start = self.synci + self.sync2fft + (window*self.fftn)
+      end = start + self.fftn
+    I = iIa[start:end]
+    Q = iQa[start:end]
 
     ## Remove DC bias
     #Q = Q - np.mean(Q)
     #I = I - np.mean(I)
+
+    return I, Q
+
+  def DFTKernel(self):
+    """Return the Windowed Complex Exponentials for the Test Tone Bins"""
+    key = (tuple(self.tonebins),self.fftn,id(self.fftwindow))
+    if self.dftkey != key:
+      self.dftkernel = DSP.DFTKernel(self.tonebins,self.fftn,self.fftwindow)
+      self.dftkey = key
+    return self.dftkernel
+    
+  def InitFFT(self):
+    """Allocate the FFT Arrays and Plan with fftdtype Precision"""
+    self.fftia = pyfftw.n_byte_align_empty(self.fftn, 16, self.fftdtype)
+    self.fftoa = pyfftw.n_byte_align_empty(self.fftn, 16, self.fftdtype)
+    ## Create FFT Plan
+    self.fft = pyfftw.FFTW(self.fftia,self.fftoa)
+    self.fftvalid = False
+    ## Real and imaginary views of the input, filled in place from the capture
+    self.fftir = self.fftia.real
+    self.fftii = self.fftia.imag
+    self.fftspectrum = np.zeros(self.fftn, dtype=self.fftdtype)
+    self.fftwindows = np.zeros((self.averages,self.tones), dtype=self.fftdtype)
+    self.InitFFTWindow()
+
+  def InitFFTWindow(self):
+    """Precompute the Window and Negated Window for the Real and Imaginary Parts of I - jQ"""
+    self.fftwindowkey = self.fftwindow
+    if self.fftwindow is not None:
+      self.fftwindowr = self.fftwindow.astype(self.fftir.dtype)
+      self.fftwindown = -self.fftwindowr
+
+  def DoFullFFT(self,iIa=None,iQa=None,window=0):
+    """Calculate the Full FFT of One FFT Window of the Last Capture"""
+    I, Q = self.FFTSlice(iIa,iQa,window)
     
-    self.fftia[:] = I - 1j * Q
-    if self.fftwindow != None: self.fftia[:] = self.fftwindow * self.fftia
+    ## Window straight into the FFT input, no temporaries
+    if self.fftwindow is not None:
+      if self.fftwindowkey is not self.fftwindow: self.InitFFTWindow()
+      np.multiply(I,self.fftwindowr,out=self.fftir)
+      np.multiply(Q,self.fftwindown,out=self.fftii)
+    else:
+      np.copyto(self.fftir,I)
+      np.negative(Q,out=self.fftii)
     
     self.fft()
+    self.fftvalid = True
+    
+  def DoFFT(self,iIa=None,iQa=None):
+    """Calculate the Test Tone Readings with the Configured Detector"""
+    if self.detector == 'dft':
+      I, Q = self.FFTSlice(iIa,iQa)
+      self.readings, self.readingvar = DSP.DFTReadings(I,Q,self.DFTKernel(),self.averages)
+      self.fftvalid = False
+    else:
+      if self.fftwindows.shape != (self.averages,self.tones):
+        self.fftwindows = np.zeros((self.averages,self.tones), dtype=self.fftdtype)
+      windows = self.fftwindows
+      spectrum = self.fftspectrum
+      for w in range(self.averages):
+        self.DoFullFFT(iIa,iQa,w)
+        np.take(self.fftoa,self.tonebins,out=windows[w])
+        if self.averages > 1:
+          if w == 0: np.copyto(spectrum,self.fftoa)
+          else: np.add(spectrum,self.fftoa,out=spectrum)
+      ## Leave the averaged spectrum for plotting
+      if self.averages > 1: np.multiply(spectrum,1.0/self.averages,out=self.fftoa)
+      ## Tones sit on whole bins so the windows are coherent and average directly
+      self.readings = windows.mean(axis=0)
+      self.readingvar = windows.var(axis=0)
+
+    self.reading = self.readings[0]
 
   def DoCoolDown(self):
     if self.cooldowntime:
@@ -420,8 +786,10 @@ class VNA:
   def DoWarmUp(self):
     if self.warmuptime:
       self.PTT(1)
-      time.sleep(self.warmuptime)
-      self.PTT(0)
+      try:
+        time.sleep(self.warmuptime)
+      finally:
+        self.PTT(0)
       self.DoCoolDown()
 
   def Test(self,iterations=1):
@@ -429,127 +797,697 @@ class VNA:
     self.DoWarmUp()
 
     for i in range(0,iterations):
-      print(i,end=" ")
       self.M()
-      self.Mprint()
+      self.Mprint(index=i)
 
       self.DoCoolDown()
+    self.progress.Flush()
 
   
   def JackProcess(self,nframes,arg):
-    """Main Jack Process Method"""
-    if not self.docapture.is_set():
+    """Main Jack Process Method, Runs in the Jack Real Time Thread"""
+    cbtimes = self.cbtimes
+    if cbtimes is not None: t = self.clock()
+    if self.streaming:
+      self.StreamProcess(nframes)
+    elif not self.docapture.is_set():
       
-      ## Copy input data
-      endframe = self.startframe + nframes
-      if endframe > self.iIa.size:
-        endframe = self.iIa.size
-        
-      tsz = (endframe-self.startframe) * ctypes.sizeof(jacklib.jack_default_audio_sample_t)
-      basei = self.startframe * ctypes.sizeof(jacklib.jack_default_audio_sample_t)
-    
-      ctypes.memmove(self.iIa.ctypes.data+basei,jacklib.port_get_buffer(self.iI,nframes),tsz)
-      ctypes.memmove(self.iQa.ctypes.data+basei,jacklib.port_get_buffer(self.iQ,nframes),tsz) 
-      ctypes.memmove(jacklib.port_get_buffer(self.oI,nframes),self.oIa.ctypes.data+basei,tsz)
-      ctypes.memmove(jacklib.port_get_buffer(self.oQ,nframes),self.oQa.ctypes.data+basei,tsz)
-      #print self.startframe,endframe,basei,tsz
-
-      self.startframe = endframe
-      if self.startframe >= self.iIa.size:
+      ## Copy input data, pointers and sizes are precomputed by SetCaptureArrays
+      ssz = self.ssz
+      basei = self.startframe * ssz
+      tsz = self.capturebytes - basei
+      if tsz > nframes * ssz: tsz = nframes * ssz
+    
+      getbuffer = self.portbuffer
+      memmove = self.memmove
+      memmove(self.iIp+basei,getbuffer(self.iI,nframes),tsz)
+      memmove(self.iQp+basei,getbuffer(self.iQ,nframes),tsz) 
+      memmove(getbuffer(self.oI,nframes),self.oIp+basei,tsz)
+      memmove(getbuffer(self.oQ,nframes),self.oQp+basei,tsz)
+
+      self.startframe += nframes
+      if self.startframe >= self.capturesamples:
         self.docapture.set() 
-              
+        if self.capturedone: self.capturedone()
+
+    if cbtimes is not None:
+      cbtimes[self.cbn % cbtimes.size] = self.clock() - t
+      self.cbn += 1
+    self.cycles += 1
+    return 0
+
+  def JackThread(self,arg):
+    """Jack Process Thread, Blocks in cycle_wait between Periods"""
+    cyclewait = self.cyclewait
+    cyclesignal = self.cyclesignal
+    process = self.JackProcess
+    client = self.jackclient
+    while self.threadrunning:
+      nframes = cyclewait(client)
+      if nframes == 0: break
+      process(nframes,arg)
+      cyclesignal(client,0)
+    return None
+
+  def StreamProcess(self,nframes):
+    """Jack Process Method for Continuous Ring Buffer Capture"""
+    ssz = self.ssz
+    tsz = nframes * ssz
+    getbuffer = self.portbuffer
+    memmove = self.memmove
+    
+    ## Input always streams into the ring
+    basei = (self.ringframes % self.ringI.size) * ssz
+    memmove(self.ringIp+basei,getbuffer(self.iI,nframes),tsz)
+    memmove(self.ringQp+basei,getbuffer(self.iQ,nframes),tsz)
+
+    ## Stimulus starts on the first period after a window is armed
+    if self.armpending:
+      self.armframe = self.ringframes
+      self.armpending = False
+
+    oI = getbuffer(self.oI,nframes)
+    oQ = getbuffer(self.oQ,nframes)
+    offset = self.ringframes - self.armframe
+    if self.armframe >= 0 and offset < self.capturesamples:
+      osz = min(nframes,self.capturesamples-offset) * ssz
+      baseo = offset * ssz
+      memmove(oI,self.oIp+baseo,osz)
+      memmove(oQ,self.oQp+baseo,osz)
+      if osz < tsz:
+        self.memset(oI+osz,0,tsz-osz)
+        self.memset(oQ+osz,0,tsz-osz)
+    else:
+      self.memset(oI,0,tsz)
+      self.memset(oQ,0,tsz)
+
+    ## Publish the frame counter only after the data is in the ring
+    self.ringframes += nframes
+    if not self.docapture.is_set() and not self.armpending and self.ringframes >= self.armframe + self.capturesamples:
+      self.docapture.set()
+      if self.capturedone: self.capturedone()
+
+  def ClaimWindow(self,startframe):
+    """Copy a Captured Window out of the Streaming Ring Buffer"""
+    ringn = self.ringI.size
+    samples = self.iIa.size
+    si = startframe % ringn
+    n1 = min(samples,ringn-si)
+    self.iIa[:n1] = self.ringI[si:si+n1]
+    self.iQa[:n1] = self.ringQ[si:si+n1]
+    self.iIa[n1:] = self.ringI[:samples-n1]
+    self.iQa[n1:] = self.ringQ[:samples-n1]
+    ## Jack may have lapped the ring while copying
+    if self.ringframes - startframe > ringn:
+      raise IndexError("Ring buffer overrun. Increase ringarrays.")
+
+  def Capture(self):
+    """Capture One Jack Array Length of Stimulus and Response"""
+    self.StartCapture()
+    self.docapture.wait()
+    self.FinishCapture()
+
+  def StartCapture(self):
+    """Arm the Jack Process Callback to Capture, docapture is Set and capturedone Called when Done"""
+    self.xrun.clear()
+    if self.reconfigure: self.Reconfigure()
+    ## startframe is reset even when streaming in case a Jack change stops streaming
+    self.startframe = 0
+    if self.streaming:
+      self.armpending = True
+    self.docapture.clear()
+
+  def FinishCapture(self):
+    """Collect the Capture after docapture is Set"""
+    if self.streaming:
+      self.ClaimWindow(self.armframe)
+
+  def JackBufferSize(self,nframes,arg):
+    """Jack Buffer Size Callback, Called with the Process Callback Stopped"""
+    self.pendingbuffersz = nframes
+    self.PauseForReconfigure()
+    return 0
+
+  def JackSampleRate(self,nframes,arg):
+    """Jack Sample Rate Callback"""
+    self.pendingSr = nframes
+    self.PauseForReconfigure()
     return 0
 
+  def PauseForReconfigure(self):
+    """Retry a Capture Spanning a Jack Change like an Xrun and Stop Streaming until Reconfigure"""
+    ## Flag before the xrun so StartCapture cannot clear the xrun and miss the change
+    self.reconfigure = True
+    self.xrun.set()
+    ## The ring and stimulus are replaced by Reconfigure, so the process callback must not
+    ## touch them and the window being captured is abandoned
+    if self.streaming:
+      self.streaming = False
+      self.resumestreaming = True
+      if not self.docapture.is_set():
+        self.docapture.set()
+        if self.capturedone: self.capturedone()
+
+  def Reconfigure(self):
+    """Apply a Pending Jack Sample Rate or Buffer Size Change between Captures"""
+    with self.reconfiglock:
+      self.reconfigure = False
+      Sr = float(self.pendingSr) if self.pendingSr else self.Sr
+      buffersz = int(self.pendingbuffersz) if self.pendingbuffersz else self.buffersz
+      if Sr != self.Sr or buffersz != self.buffersz:
+        self.progress.Message("Jack reconfigured, sample rate was",self.Sr,"now",Sr,"buffer size was",self.buffersz,"now",buffersz)
+        self.Sr = Sr
+        self.dt = 1.0/self.Sr
+        ## Keep the test tone bin so the stimulus in samples, and readings taken before the
+        ## change, stay comparable. The test tone frequency moves with the sample rate.
+        self.freq = (float(self.fftbin)/self.fftn) * self.Sr
+        self.InitTones()
+        if buffersz != self.buffersz:
+          ## A measured round trip latency does not survive a new buffer size
+          self.autortframes = True
+          ## Periods must stay aligned to the ring, streaming is stopped so the counter is free
+          self.ringframes = 0
+        self.buffersz = buffersz
+        self.minrtframes = self.MinRTFrames()
+        ## Unless it was measured before for this configuration
+        rtframes = self.CachedLatency()
+        if rtframes is not None:
+          self.autortframes = False
+          self.rtframes = rtframes
+        elif self.autortframes:
+          self.rtframes = self.minrtframes
+        self.synclast = None
+        ## The callback stopped streaming, make sure its last period is done with the ring
+        if self.resumestreaming: self.WaitCycle()
+        ## Rebuilds the stimulus, sync template and capture pointers, the kernels follow the tone bins
+        self.InitJackArrays(self.freq,self.ArrayLength())
+        ## Captures queued before the change are remeasured
+        self.configgen += 1
+      if self.resumestreaming:
+        self.resumestreaming = False
+        self.StartStreaming()
+
   def JackXrun(self,arg):
     """Jack Xrun Callback"""
+    self.xruncount += 1
     self.xrun.set()
     return 0
 
     
-  def Mprint(self,isdut=False):
-    """Print Information for a Measurement"""
+  def Mprint(self,isdut=False,freq=None,index=None):
+    """Post Information for a Measurement to the Progress Sinks"""
     if self.printlevel > 0:
-      print("Sync:%d" % self.synci,end=" ")
-      print("Freq:%d" % int(round(self.GetFreq()+self.freq)),end=" ")
-      cn = self.fftoa[self.fftbin]
-      print("Real:%3.2f" % cn.real,end=" ")
-      print("Imag:%3.2f" % cn.imag,end=" ")
-      print("Mag:%3.2f" % np.abs(cn),end=" ")
-      print("Phase:%3.2f" % np.angle(cn,deg=True))
+      if freq is None: freq = self.LOFreq()+self.freq
+      ## One record per test tone
+      for j in range(self.tones):
+        std = np.sqrt(self.readingvar[j]) if self.averages > 1 else None
+        ## Already filtered by printlevel, which may have changed since the progress sink started
+        self.progress.Post('point',level=0,synci=self.synci,freq=freq+(j*self.tonespacing),
+                           reading=self.readings[j],std=std,index=index)
       
       #print "Bins",np.abs(self.fftoa[self.fftbin-1]),np.abs(self.fftoa[self.fftbin]),np.abs(self.fftoa[self.fftbin+1])
       
-  def M(self,freq=None,ptt=True,warmup=False):
-    """Main Measurement Method"""
-    if freq: 
-      #time.sleep(0.2)
-      self.SetFreq(freq-self.freq)
-      time.sleep(0.005)
+  def Tune(self,freq,word=None):
+    """Tune so the Test Tone is at freq and Wait for the SoftRock to Settle"""
+    #time.sleep(0.2)
+    self.SetTune(freq,word)
+    self.Stamp('setfreq')
+    self.Settle()
+    self.Stamp('settle')
+
+  def SetTune(self,freq,word=None):
+    """Set the SoftRock so the Test Tone is at freq, Applying a Pending Jack Change First"""
+    ## A sample rate change moves the test tone, which the LO must follow
+    iffreq = self.freq
+    if self.reconfigure: self.Reconfigure()
+    ## A precomputed payload is for the test tone before the change
+    if self.freq != iffreq: word = None
+    self.SetFreq(freq-self.freq,word)
+    self.tunedfreq = freq
+    self.tunedif = self.freq
+
+  def Detuned(self):
+    """Return True if a Jack Change Moved the Test Tone since the Last Tune"""
+    return self.tunedfreq is not None and self.tunedif != self.freq
+
+  def Settle(self):
+    """Wait for the SoftRock to Settle after the Last Retune"""
+    time.sleep(self.settletime[self.retune])
+
+  def Settled(self,iIa=None,iQa=None):
+    """Return False if the Test Tone Phase Drifts Across the FFT Windows"""
+    I, Q = self.FFTSlice(iIa,iQa)
+    h = self.fftn // 2
+    key = (tuple(self.tonebins),self.fftn)
+    if self.settlekey != key:
+      ## Least squares fit of all tones over each half window, so other tones do not leak in
+      n = np.arange(self.fftn)
+      e = np.exp(2j*np.pi*np.outer(n,self.tonebins)/self.fftn)
+      self.settlekernel = (np.linalg.pinv(e[:h]),np.linalg.pinv(e[h:]))
+      self.settlekey = key
+    ## First half of the first window against the second half of the last window
+    a = np.dot(self.settlekernel[0],I[:h] - 1j * Q[:h])[0]
+    b = np.dot(self.settlekernel[1],I[-h:] - 1j * Q[-h:])[0]
+    return abs(np.angle(b*np.conj(a),deg=True)) <= self.settlephase
+
+  def CaptureOnce(self,ptt=True):
+    """Capture with Optional PTT, Return False if an Xrun Occurred"""
+    if ptt: self.PTT(1) 
+    self.Stamp('ptton')
+    
+    ## Unkey even when interrupted
+    try:
+      self.Capture()
+      self.Stamp('capture')
+    finally:
+      if ptt: self.PTT(0)
+    self.Stamp('pttoff')
+    
+    return not self.xrun.is_set()
+      
+  def M(self,freq=None,ptt=True,warmup=False,word=None):
+    """Main Measurement Method, Return False and NaN Readings if All Attempts Fail"""
+    self.TimingStart()
+    if freq: self.Tune(freq,word)
 
     if warmup: self.DoWarmUp()
     
-    attempts = 5
-    while attempts > 0:
+    attempts = self.attempts
+    self.syncfailrun = 0
+    success = False
+    while attempts > 0 and not success:
+      attempts = attempts - 1
+      if self.Detuned(): self.Tune(self.tunedfreq)
       try:
-        if ptt: self.PTT(1) 
-    
-        self.startframe = 0
-        self.xrun.clear()
-        self.docapture.clear()
-        self.docapture.wait()
-
-        if ptt: self.PTT(0)
-
-        if self.xrun.is_set():
-          ## An xrun occurred, attempt again
-          print("XRUN during measurement, retrying")
-          attempts = attempts -1
-        else:
-          self.Sync()
-          attempts = 0
-      except:
-        print("Error during measurement, retrying")
-        attempts = attempts - 1
+        success = self.CheckAttempt(self.CaptureOnce(ptt))
+      except Exception as e:
+        self.FailedAttempt(e)
       
+    return self.EndAttempts(success)
+
+  def CheckAttempt(self,captured):
+    """Sync a Capture, Return True if it Can be Used"""
+    if not captured:
+      ## An xrun occurred, attempt again
+      self.progress.Message("XRUN during measurement, retrying")
+      self.stats['xruns'] += 1
+      return False
+    if self.Detuned():
+      ## Reconfigured when the capture started, the LO is for the old test tone
+      self.progress.Message("Jack reconfigured during measurement, retuning")
+      return False
+    self.Sync()
+    self.Stamp('sync')
+    self.syncfailrun = 0
+    if self.settledetect and not self.Settled():
+      self.progress.Message("SoftRock not settled during measurement, retrying")
+      self.stats['unsettled'] += 1
+      return False
+    return True
+
+  def FailedAttempt(self,e):
+    """Count an Exception Raised during an Attempt and Adapt the Arrays to Repeated Sync Failures"""
+    if isinstance(e,IndexError):
+      self.progress.Message("Sync failed during measurement, retrying:",e)
+      self.stats['syncfails'] += 1
+      self.syncfailrun += 1
+      ## Repeated sync failures usually mean the response arrives after the array ends
+      if self.syncresize and self.syncfailrun >= self.syncresize and self.stats['resizes'] < self.syncresizemax:
+        ## Grow from the latency the arrays already hold, which exceeds rtframes with a loose fit
+        held = self.iIa.size - (self.rtframes2sync + self.sync2fft + (self.averages*self.fftn) + self.fft2end)
+        self.ResizeArrays(max(self.rtframes,held) + self.buffersz)
+        self.stats['resizes'] += 1
+        self.syncfailrun = 0
+    else:
+      self.progress.Message("Error during measurement, retrying:",e)
+      self.stats['errors'] += 1
+
+  def EndAttempts(self,success):
+    """Compute the Readings after the Last Attempt, NaN if None Succeeded"""
+    if not success:
+      self.progress.Message("Measurement failed after",self.attempts,"attempts")
+      self.stats['exhausted'] += 1
+      self.readings = np.full(self.tones, complex(np.nan,np.nan))
+      self.readingvar = np.full(self.tones, np.nan)
+      self.reading = self.readings[0]
+      return False
+
     self.DoFFT()
+    self.Stamp('fft')
+    return True
     
-  def M2Array(self,freq,array):
+  def M2Array(self,freq,array,plan=None):
     """Array of Main Measurements Method"""
+    if self.pipeline: return self.M2ArrayPipelined(freq,array,plan)
+    
+    try:
+      for i, f, reading, quality in self.SweepIter(freq,plan):
+        array[i] = reading
+    except Exception as e:
+      self.progress.Message("Error during array measurement:",e)
+      self.progress.Flush()
+    return self.failed
+
+  def SweepIter(self,freq,plan=None):
+    """Measure Frequencies in MHz and Yield Each Point as Soon as it is Measured
+
+    Yields the frequency index, frequency, reading and quality, the sync confidence
+    or 0.0 if the point failed. In 'phase' sync mode the confidence scores how close
+    the phase step is to a reversal. Closing the generator early stops the sweep."""
+    self.ResetStats()
+    self.RecordSweep(freq)
     try:
 
       self.DoWarmUp()
     
-      i = 0
-      for f in freq:
-        self.M(int(f*1000000))
-        array[i] = self.fftoa[self.fftbin]
-        self.Mprint()
-        i += 1
+      for f, indices, word in self.PlanSteps(freq,plan):
+        success = self.M(f,word=word)
+        if success:
+          self.Record(f,indices)
+          self.Mprint()
+        else:
+          self.Record(f,indices,synced=False)
+          self.failed.extend(indices)
+        self.Stamp('print')
+        quality = self.syncconf if success else 0.0
+        for j, i in enumerate(indices):
+          yield i, freq[i], self.readings[j], quality
         self.DoCoolDown()
-    except:
-      print("Error during array measurement")
-    self.PTT(0)    
+    finally:
+      self.PTT(0)
+      self.PrintStats()
+      self.progress.Flush()
+
+  def M2ArrayPipelined(self,freq,array,plan=None):
+    """Array of Main Measurements with Sync and FFT Overlapping the Next Capture"""
+    ## Double buffered capture arrays, one is captured while the other is processed
+    free = queue.Queue()
+    free.put((self.iIa,self.iQa))
+    free.put((np.zeros_like(self.iIa),np.zeros_like(self.iQa)))
+    work = queue.Queue()
+    failed = []
+    worker = threading.Thread(target=self.PipelineWorker,args=(work,free,array,failed))
+    worker.daemon = True
+    worker.start()
+    self.ResetStats()
+    self.RecordSweep(freq)
+    
+    try:
 
-  def MO(self,m):
+      self.DoWarmUp()
+      
+      for f, indices, word in self.PlanSteps(freq,plan):
+        self.TimingStart()
+        self.Tune(f,word)
+        iIa, iQa = free.get()
+        if self.reconfigure: self.Reconfigure()
+        if self.Detuned(): self.Tune(f)
+        if iIa.size != self.oIa.size:
+          ## Reconfigured since this buffer was allocated
+          iIa, iQa = np.zeros_like(self.oIa), np.zeros_like(self.oQa)
+        self.SetCaptureArrays(iIa,iQa)
+        attempts = self.attempts
+        while attempts > 0 and not self.CaptureOnce():
+          self.progress.Message("XRUN during measurement, retrying")
+          self.stats['xruns'] += 1
+          attempts = attempts - 1
+        if attempts > 0:
+          work.put((f,indices,self.iIa,self.iQa,self.timingrow,self.configgen))
+        else:
+          failed.append((f,indices))
+          free.put((self.iIa,self.iQa))
+        self.DoCoolDown()
+    except Exception as e:
+      self.progress.Message("Error during array measurement:",e)
+    finally:
+      ## Unkey and stop the worker even when interrupted
+      self.PTT(0)
+      work.put(None)
+      worker.join()
+    
+    ## Points that could not be synchronized are measured again serially
+    if failed:
+      self.progress.Message("Remeasuring",len(failed),"captures")
+      try:
+        for f, indices in failed:
+          if self.M(f):
+            self.Record(f,indices)
+            self.Mprint()
+          else:
+            self.Record(f,indices,synced=False)
+            self.failed.extend(indices)
+          for j, i in enumerate(indices):
+            array[i] = self.readings[j]
+          self.Stamp('print')
+          self.DoCoolDown()
+      except Exception as e:
+        self.progress.Message("Error during array measurement:",e)
+      finally:
+        self.PTT(0)
+    self.PrintStats()
+    self.progress.Flush()
+    return self.failed
+
+  def PipelineWorker(self,work,free,array,failed):
+    """Sync and FFT Captures Queued by M2ArrayPipelined"""
+    while True:
+      item = work.get()
+      if item is None: return
+      f, indices, iIa, iQa, row, gen = item
+      self.reconfiglock.acquire()
+      try:
+        if gen != self.configgen:
+          raise IndexError("Jack reconfigured after capture")
+        self.Sync(iIa,iQa)
+        self.Stamp('sync',row)
+        if self.settledetect and not self.Settled(iIa,iQa):
+          self.stats['unsettled'] += 1
+          failed.append((f,indices))
+        else:
+          self.Record(f,indices,iIa,iQa)
+          self.DoFFT(iIa,iQa)
+          self.Stamp('fft',row)
+          for j, i in enumerate(indices):
+            array[i] = self.readings[j]
+          self.Mprint(freq=f)
+          self.Stamp('print',row)
+      except IndexError:
+        self.stats['syncfails'] += 1
+        failed.append((f,indices))
+      except Exception:
+        self.stats['errors'] += 1
+        failed.append((f,indices))
+      self.reconfiglock.release()
+      free.put((iIa,iQa))
+
+  def PlanSteps(self,freq,plan=None):
+    """Yield the Captures of a Sweep from a Sweep Plan if it Matches, otherwise Compute Them"""
+    if plan is not None:
+      if plan.Matches(self,freq):
+        return self.PlanWords(plan)
+      print("Sweep plan does not match the frequencies or VNA settings, ignoring it")
+    if self.schedule:
+      return self.PlanWords(self.CompilePlan(freq,True))
+    return ((f,indices,None) for f, indices in self.SweepSteps(freq))
+
+  def PlanWords(self,plan):
+    """Yield the Captures of a Sweep Plan, Dropping the Payloads once a Jack Change Moves the Test Tone"""
+    for f, indices, word in plan.Steps():
+      yield f, indices, (word if self.freq == plan.iffreq else None)
+
+  def CompilePlan(self,freq,schedule=False):
+    """Compile a Sweep Plan for an Array of Frequencies in MHz"""
+    return SweepPlan(self,freq,schedule)
+
+  def SweepSteps(self,freq):
+    """Group Frequencies in MHz into Captures, One Test Tone per Frequency"""
+    ## Consecutive frequencies one tone spacing apart, within half a bin, share a capture
+    spacing = self.tonespacing / 1.0e6
+    tolerance = (0.5 * self.Sr / self.fftn) / 1.0e6
+    i = 0
+    while i < len(freq):
+      n = 1
+      while n < self.tones and (i+n) < len(freq) and abs(freq[i+n] - freq[i] - (n*spacing)) < tolerance:
+        n += 1
+      yield int(freq[i]*1000000), list(range(i,i+n))
+      i += n
+    
+  def MO(self,m,plan=None):
     """Measure Open Standard"""
     print("Beginning Open Measurements")
-    self.M2Array(m.freq,m.open)
+    self.recordtag = 'open'
+    self.M2Array(m.freq,m.open,plan)
     
-  def MS(self,m):
+  def MS(self,m,plan=None):
     """Measure Short Standard"""
     print("Beginning Short Measurements")
-    self.M2Array(m.freq,m.short)
+    self.recordtag = 'short'
+    self.M2Array(m.freq,m.short,plan)
     
-  def ML(self,m):
+  def ML(self,m,plan=None):
     """Measure Load Standard"""
     print("Beginning Load Measurements")
-    self.M2Array(m.freq,m.load)
+    self.recordtag = 'load'
+    self.M2Array(m.freq,m.load,plan)
 
-  def MD(self,m):
+  def MD(self,m,plan=None):
     """Measure DUT"""
     print("Beginning DUT Measurements")
-    self.M2Array(m.freq,m.dut)
+    self.recordtag = 'dut'
+    self.M2Array(m.freq,m.dut,plan)
     
+  ## Retry telemetry
+  def ResetStats(self):
+    """Reset the Sweep Counters and List of Failed Frequency Indices"""
+    self.stats = {'xruns':0, 'syncfails':0, 'unsettled':0, 'errors':0, 'exhausted':0, 'resizes':0}
+    self.failed = []
+
+  def PrintStats(self):
+    """Print the Sweep Counters if Anything Went Wrong"""
+    if any(self.stats.values()):
+      self.progress.Message("Sweep retries",", ".join("%s:%d" % (k,v) for k, v in sorted(self.stats.items())),
+                            "Failed points:",len(self.failed))
+
+  ## Process callback timing
+  def CallbackStats(self):
+    """Return and Print the Process Callback Duration Statistics in Seconds and as a Fraction of the Period"""
+    if self.cbtimes is None: return {}
+    a = self.cbtimes[:min(self.cbn,self.cbtimes.size)]
+    if a.size == 0: return {}
+    period = self.buffersz / self.Sr
+    stats = {'n':self.cbn, 'period':period, 'mean':a.mean(), 'p99':np.percentile(a,99), 'max':a.max()}
+    stats['load'] = stats['mean'] / period
+    stats['maxload'] = stats['max'] / period
+    print("Process callback mean:%.1fus p99:%.1fus max:%.1fus period:%.1fus load:%.2f%% max load:%.2f%%" %
+          (1e6*stats['mean'],1e6*stats['p99'],1e6*stats['max'],1e6*period,100*stats['load'],100*stats['maxload']))
+    return stats
+
+  ## Stage timing
+  def TimingStart(self):
+    """Start the Timestamps of a New Capture"""
+    if self.timing:
+      self.timingrow = self.timingn % self.timing
+      self.timingn += 1
+      row = self.timings[self.timingrow]
+      row[1:] = np.nan
+      row[0] = time.monotonic()
+
+  def Stamp(self,stage,row=None):
+    """Record the End of a Stage of the Current or Given Capture"""
+    if self.timing:
+      self.timings[self.timingrow if row is None else row,TIMINGCOLUMN[stage]] = time.monotonic()
+
+  def TimingClear(self):
+    """Discard All Timestamps"""
+    self.timings[:] = np.nan
+    self.timingn = 0
+
+  def TimingRows(self):
+    """Return the Timestamps of the Kept Captures, Oldest First"""
+    n = min(self.timingn,self.timing)
+    start = self.timingn % self.timing if self.timingn > self.timing else 0
+    return np.roll(self.timings[:n],-start,axis=0)
+
+  def TimingDurations(self):
+    """Return the Seconds Spent in Each Stage of Each Kept Capture, NaN if Skipped"""
+    t = self.TimingRows()
+    d = np.full((t.shape[0],len(TIMINGSTAGES)), np.nan)
+    ## Each stage runs from the last stage stamped before it
+    last = np.copy(t[:,0])
+    for k in range(len(TIMINGSTAGES)):
+      c = t[:,k+1]
+      v = ~np.isnan(c)
+      d[v,k] = c[v] - last[v]
+      last[v] = c[v]
+    return d
+
+  def TimingSummary(self):
+    """Return and Print the Mean, Median and 99th Percentile of Each Stage in Seconds"""
+    d = self.TimingDurations()
+    summary = {}
+    for k, s in enumerate(TIMINGSTAGES + ['total']):
+      a = np.nansum(d,axis=1) if s == 'total' else d[:,k]
+      a = a[~np.isnan(a)]
+      if a.size == 0: continue
+      summary[s] = {'n':a.size, 'mean':a.mean(), 'p50':np.percentile(a,50), 'p99':np.percentile(a,99)}
+      if self.printlevel > 0:
+        print("%-8s n:%-6d mean:%8.3fms p50:%8.3fms p99:%8.3fms" % (s,a.size,1e3*summary[s]['mean'],1e3*summary[s]['p50'],1e3*summary[s]['p99']))
+    return summary
+
+  def SaveTrace(self,fn):
+    """Save the Stage Timings as a Chrome Trace Event JSON File"""
+    t = self.TimingRows()
+    t0 = np.nanmin(t[:,0]) if t.size else 0.0
+    events = []
+    for k in range(t.shape[0]):
+      last = t[k,0]
+      events.append({'name':'capture %d' % k, 'ph':'i', 's':'t', 'ts':1e6*(last-t0), 'pid':0, 'tid':0})
+      for j, s in enumerate(TIMINGSTAGES):
+        if np.isnan(t[k,j+1]): continue
+        ## Sync, FFT and print run on the worker thread when pipelined
+        tid = 1 if (self.pipeline and s in ['sync','fft','print']) else 0
+        events.append({'name':s, 'ph':'X', 'ts':1e6*(last-t0), 'dur':1e6*(t[k,j+1]-last), 'pid':0, 'tid':tid})
+        last = t[k,j+1]
+    f = open(fn,'w')
+    json.dump({'traceEvents':events, 'displayTimeUnit':'ms'},f)
+    f.close()
+
+  ## Recording and replay
+  def RecordSettings(self):
+    """Return the Settings Needed to Reprocess Recorded Captures"""
+    return {'Sr':self.Sr, 'buffersz':self.buffersz, 'minrtframes':self.minrtframes,
+            'fftn':self.fftn, 'freq':self.freq, 'amp':self.amp, 'tones':self.tones,
+            'tonestep':self.tonestep, 'tonespacing':self.tonespacing, 'averages':self.averages,
+            'rtframes':self.rtframes, 'rtframes2sync':self.rtframes2sync,
+            'sync2fft':self.sync2fft, 'fft2end':self.fft2end,
+            'syncmode':self.syncmode, 'syncconfidence':self.syncconfidence}
+
+  def StartRecording(self,fn):
+    """Record the Raw Samples of Every Sweep Capture to fn.vrr and fn.vri"""
+    self.StopRecording()
+    self.recorder = CaptureRecorder(fn,self.RecordSettings())
+
+  def StopRecording(self):
+    """Finish the Current Recording"""
+    if self.recorder is not None:
+      self.recorder.Close()
+      print("Recorded",len(self.recorder.index),"captures to",self.recorder.fn)
+      self.recorder = None
+
+  def Record(self,freq,indices,iIa=None,iQa=None,synced=True):
+    """Append a Capture to the Current Recording, Failed Captures are Recorded with synci None"""
+    if self.recorder is None: return
+    if iIa is None: iIa = self.iIa
+    if iQa is None: iQa = self.iQa
+    self.recorder.Append(iIa,iQa,freq,self.synci if synced else None,self.recordtag,indices)
+
+  def RecordSweep(self,freq):
+    """Store the Frequencies in MHz of a Sweep in the Current Recording"""
+    if self.recorder is None: return
+    self.recorder.UpdateSettings(sweepfreq=list(freq))
+
+  def Replay(self,fn,m=None):
+    """Rebuild a Measurement from a Recording with the Current Sync and FFT Settings"""
+    rec = Recording(fn)
+    if m is None: m = rec.NewMeasurement()
+    for k in range(len(rec)):
+      e = rec.index[k]
+      iIa, iQa = rec.Capture(k)
+      array = getattr(m,e['tag'])
+      try:
+        self.Sync(iIa,iQa)
+        self.DoFFT(iIa,iQa)
+      except (IndexError, ValueError) as err:
+        self.progress.Message("Error replaying capture",k,err)
+        ## Like a measurement whose attempts all failed
+        for i in e['indices']:
+          array[i] = complex(np.nan,np.nan)
+        continue
+      for j, i in enumerate(e['indices']):
+        array[i] = self.readings[j]
+      self.Mprint(freq=e['freq'])
+    return m
+
   def SWR(self,m,iterations=100):
     """Make Iteration Number of SWR Measurements at Current Frequency"""
     if m.freq.size != 1:
@@ -560,9 +1498,10 @@ class VNA:
 
     for j in range(0,iterations):
       self.M(int(m.freq[0]*1000000))
-      m.dut[0] = self.fftoa[self.fftbin]
-      m.PrintSWR()
+      m.dut[0] = self.reading
+      self.progress.Post('swr',level=0,freq=m.freq[0],swr=m.SWR()[0])
       self.DoCoolDown()
+    self.progress.Flush()
  
   def PlotTD(self):
     """Plot Time Domain of Jack Input and Output Arrays for Last Measurement"""
@@ -579,7 +1518,8 @@ class VNA:
     sp.plot([self.rtframes,self.rtframes],[-maxy,maxy],'k-',lw=3,label='RT Frames')
     ## Identify Sync Index
     sp.plot([self.synci+self.sync2fft,self.synci+self.sync2fft],[-maxy,maxy],'g-',lw=3,label='FFT Start')
-    sp.plot([self.synci+self.sync2fft+self.fftn,self.synci+self.sync2fft+self.fftn],[-maxy,maxy],'y-',lw=3,label='FFT End')      
+    fftend = self.synci+self.sync2fft+(self.averages*self.fftn)
+    sp.plot([fftend,fftend],[-maxy,maxy],'y-',lw=3,label='FFT End')      
     sp.set_ylabel("Magnitude")
     sp.set_xlabel("Sample")
     #sp.legend(bbox_to_anchor=(1,-0.1))  
@@ -590,6 +1530,7 @@ class VNA:
   
   def PlotFFTInput(self):
     """Plot Time Domain of FFT Input Slice for Last Measurement"""
+    if not self.fftvalid: self.DoFullFFT()
     fig = self.CreateFigure("FFT Input")
     sp = fig.add_subplot(111)
     xaxis = range(0,self.fftn)
@@ -604,6 +1545,7 @@ class VNA:
 
   def PlotFD(self,dbfs=True):
     """Plot Frequency Domain for Last Measurement"""
+    if not self.fftvalid: self.DoFullFFT()
     freqspectrum = np.abs(self.fftoa)
     freqspectrum = np.concatenate( [freqspectrum[self.fftn/2:self.fftn],freqspectrum[0:self.fftn/2]] )
     if dbfs:
@@ -633,7 +1575,7 @@ class VNA:
     '''Measure accuracy of uncorrect reflection coefficient for large number of repititions'''
     if freq:
       self.SetFreq(freq)
-      time.sleep(0.005)   
+      self.Settle()
 
     ## Create NP array with proper dimensions
     a = np.zeros( repititions, dtype=np.complex )
@@ -642,7 +1584,7 @@ class VNA:
 
     for i in range(repititions):
       self.M()
-      cn = self.fftoa[self.fftbin]
+      cn = self.reading
       a[i] = cn
 
       self.DoCoolDown()
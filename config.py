@@ -12,12 +12,32 @@ freq = 2350.0
 amp = 1.0
 #amp = 0.12
 
+## Number of test tones in the stimulus. Each tone measures one sweep point per capture.
+## Tones are spaced tonestep FFT bins apart starting at freq and share the amplitude above.
+## Sweeps whose frequency step equals the tone spacing need 1/tones of the captures.
+## Measure all standards and the DUT with the same number of tones.
+tones = 1
+
+## Spacing between test tones in FFT bins. Must be at least 2 so windowed tones do not interfere.
+tonestep = 8
+
 #### Timing parameters
 ## Round trip time in samples from start of test tone to when test tone is received
 ## Typically set this to None if unknown
-## After a test, you can and should execute ResizeArrays() to set this tightly
+## After a test, you can and should execute ResizeArrays() to set this tightly,
+## or measure it with CalibrateLatency()
 rtframes = None  
 
+## Round trip latency calibration, see VNA.CalibrateLatency
+## Set True to measure rtframes with a chirp probe when the VNA starts, the result is kept in the
+## file latencycache for the Jack ports, buffer size and sample rate so the probe is sent once
+latencycalibrate = False
+latencycache = 'latency.pkl'
+
+## Length of the chirp probe and the longest round trip latency searched for, in frames
+latencyprobe = 1024
+latencymax = 16384
+
 ## Time in samples from start of test tone to when phase reversal sync happens
 rtframes2sync = 50
 
@@ -27,6 +47,80 @@ sync2fft = 50
 ## Time in smaples from end of FFT window to end of test tone. 
 fft2end = 10
 
+## Number of consecutive FFT windows captured after one sync and coherently averaged
+## Noise improves by the square root of averages at the cost of a longer capture
+averages = 1
+
+## Method used to locate the phase reversal sync in a capture
+## 'phase' finds the test tone by amplitude and then the first large phase step
+## 'xcorr' cross-correlates the capture with the stimulus around the phase reversal,
+## which is more robust and is recommended with more than one test tone
+syncmode = 'phase'
+
+## Minimum normalized correlation, 0 to 1, accepted as a good sync in 'xcorr' mode
+syncconfidence = 0.5
+
+## Set True to first look for the sync within synctracktol samples of the last sync index
+## and only search the whole capture when it is not found there. Useful with stable latency.
+synctrack = False
+synctracktol = 8
+
+
+#### Capture engine
+## Set True to run Jack continuously into a ring buffer and claim each capture window from it
+## Set False to start and stop the Jack capture for every measurement
+streaming = False
+
+## Length of the streaming ring buffer in multiples of the Jack array length
+ringarrays = 4
+
+## Set True to run Sync and the detector for each point in a worker thread while the next point
+## is tuned and captured, otherwise False to measure each point serially
+pipeline = False
+
+## Set True to measure sweep frequencies in ascending order, grouping points within the Si570
+## smooth tune range, so interleaved or multi-band frequency lists need fewer slow DCO jumps.
+## Readings are stored at the original frequency indices.
+schedule = False
+
+## Detector used to extract the test tone from a capture
+## 'fft' computes the full windowed FFT for every measurement
+## 'dft' computes only the test tone bin, the full FFT is computed on demand for plots
+detector = 'fft'
+
+## Precision of the FFT detector, 'complex128' or 'complex64'
+## complex64 halves the memory traffic of the FFT and is ample for 16 to 24 bit audio
+fftdtype = 'complex128'
+
+## Number of attempts to capture and sync a point before it is marked failed with NaN readings
+attempts = 5
+
+## After this many consecutive sync failures at one point the arrays are resized so the
+## response may arrive one Jack buffer later, 0 to never resize
+syncresize = 2
+
+## Most times the arrays are grown by one Jack buffer in one sweep
+syncresizemax = 8
+
+## Number of Jack process callback durations to keep, 0 disables the timing
+## See VNA.CallbackStats
+callbackstats = 0
+
+## Number of captures to keep per stage timing stamps for, 0 disables the timing
+## See VNA.TimingSummary and VNA.SaveTrace
+timing = 0
+
+
+#### Backend
+## 'jack' uses the Jack server and the SoftRock on USB
+## 'sim' uses a simulated Jack server and SoftRock, see the simulation settings below
+## 'replay' reprocesses the recording named by replay, see Recorder.ReplayConfig
+backend = 'jack'
+replay = None
+
+## 'callback' has Jack call into Python every period
+## 'thread' runs a dedicated Jack process thread that blocks in jack_cycle_wait between periods
+processmode = 'callback'
 
 #### Jack connection information
 ## I input channel
@@ -61,6 +155,23 @@ ZfromGamma = True
 GammafromZ = False
 
 
+#### SoftRock frequency
+## Set True to read the running frequency back over USB whenever it is printed and warn if it
+## differs from the frequency last set, otherwise the last set frequency is printed
+verifyfreq = False
+
+#### SoftRock retune settling
+## Time in seconds to wait after a retune, by kind of retune
+## 'smooth' is a change within the Si570 smooth tune range of the last DCO frequency
+## 'jump' is a change that requires a new DCO frequency and is much slower to settle
+settletime = {'smooth':0.001, 'jump':0.010}
+
+## Set True to check each capture for phase drift between the two halves of the FFT window
+## and capture again if the SoftRock has not settled. settlephase is the allowed drift in degrees.
+settledetect = False
+settlephase = 2.0
+
+
 #### Heating/stability defaults
 ## The time in seconds to warm up before making a measurement or series of measurements
 ## Specify None if no warmuptime is desired
@@ -73,6 +184,41 @@ warmuptime = 0.3
 cooldowntime = 0.07
 
 
+#### Simulation settings for backend = 'sim'
+## Sample rate and Jack buffer size in frames
+simsr = 48000
+simbuffersz = 256
+
+## Round trip latency in frames from output to input
+simlatency = 1000
+
+## DUT impedance, a complex number or None for an open
+simdutz = 50+0j
+
+## Gain and leakage of the simulated bridge and standard deviation of the added noise
+simgain = 0.5
+simleakage = 0.1+0.05j
+simnoise = 0.001
+
+## Probability of an xrun in each Jack period
+simxrunprob = 0.0
+
+## Speed of the simulated Jack clock relative to real time
+simspeed = 1.0
+
+## SoftRock startup frequency in Hz, settling time in seconds by kind of retune
+## and LO frequency error in Hz while settling
+simstartupfreq = 14000000
+simsettletime = {'smooth':0.0005, 'jump':0.008}
+simsettledrift = 50.0
+
+
 ## Print verbosity
 ## 0 is none, 1 and higher increases verbosity
 printlevel = 1
+
+## Per point progress records are written by a background thread so printing never stalls
+## a measurement. Records beyond progressqueue waiting to be written are dropped.
+## Set progresslog to a file name to also append every record to it as JSON lines.
+progressqueue = 1024
+progresslog = None